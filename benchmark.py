@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# coding: utf8
+
+# Microbenchmark of the per-packet decode cost of frequent Qualcomm log codes
+# "old": literal format strings unpacked from sliced bytes copies
+# "new": precompiled diagstructs and schema decoders unpacked from memoryviews at offsets
+# "full": QualcommParser.parse_diag_log() including GSMTAP encapsulation
+
+import parsers
+import writers
+from parsers.qualcomm import diagstructs
+
+import argparse
+import contextlib
+import os
+import struct
+import timeit
+
+def log_packet(log_id, body):
+    # DIAG_LOG_F, more, len, len, log ID, TS
+    log_len = len(body) + 12
+    return struct.pack('<BBHHHQ', 0x10, 0x00, log_len, log_len, log_id, 0x0000d5a2b0c81234) + body
+
+def ncell_v5_body(n_cells):
+    body = struct.pack('<BBHLH2x', 5, 1, 0, 1300, n_cells << 6)
+    for i in range(n_cells):
+        body += struct.pack('<LLLLHHLLL', (0x6a0 << 20) | (0x3a0 << 9) | i, 0x6a0 << 12, 0x120 << 12, 0x120, 0, 0, 0, 0, 0)
+    return body
+
+SAMPLES = {
+    0xB0C0: log_packet(0xB0C0, bytes.fromhex('14 0e 30 01 09 01 9c 18 00 00 00 00 09 00 00 00 00 18 00 08 10 a7 14 53 59 a6 05 43 68 c0 3b da 30 04 a6 88 02 8d a2 00 9a 68 40')),
+    0xB0EC: log_packet(0xB0EC, bytes.fromhex('01 0c 0b 00 07 42 01 49 06 20 45 f0 01 00 01 00 01 5e 00')),
+    0xB17F: log_packet(0xB17F, struct.pack('<BB2xLHH', 5, 1, 1300, 0x111, 0) + struct.pack('<LLLLLLL', 0x6a0, 0x6a0, 0x120 << 20 | 0x120, 0x3a0 << 10, 0, 0, 0)),
+    0xB180: log_packet(0xB180, ncell_v5_body(4)),
+}
+
+# Decoding as done before diagstructs
+
+def decode_old(pkt):
+    xdm_hdr = struct.unpack('<HHQ', pkt[4:16])
+    body = pkt[16:]
+    if xdm_hdr[1] == 0xB0C0:
+        msg_hdr = struct.unpack('<BHBHLHBLH', body[0:19])
+        msg_content = body[19:]
+        return (msg_hdr[3], msg_hdr[4], (msg_hdr[5] & 0xfff0) >> 4, msg_hdr[5] & 0xf, msg_hdr[6]), msg_content
+    elif xdm_hdr[1] == 0xB0EC:
+        return body[4:]
+    elif xdm_hdr[1] == 0xB17F:
+        earfcn = struct.unpack('<L', body[4:8])[0]
+        pci = (body[8] | body[9] << 8) & 0x1ff
+        rsrp = struct.unpack('<LL', body[12:20])
+        interim = struct.unpack('<LLLL', body[20:36])
+        r9_data = struct.unpack('<L', body[36:40])[0]
+        return earfcn, pci, rsrp[0] & 0xfff, interim[0] & 0x3ff, interim[1] >> 10, r9_data & 0x7f
+    elif xdm_hdr[1] == 0xB180:
+        earfcn = struct.unpack('<L', body[4:8])[0]
+        n_cells = (body[8] | body[9] << 8) >> 6
+        cells = []
+        for i in range(n_cells):
+            n_cell_pkt = body[12 + 32 * i:12 + 32 * (i + 1)]
+            interim = struct.unpack('<LLLLHHLL', n_cell_pkt[0:28])
+            cells.append((interim[0] & 0x1ff, (interim[0] >> 9) & 0x7ff, interim[0] >> 20, (interim[2] >> 12) & 0x3ff))
+        return earfcn, cells
+
+def decode_new(pkt):
+    # pkt is the memoryview run_diag creates once per frame
+    xdm_hdr = diagstructs.DIAG_LOG_HEADER.unpack_from(pkt, 4)
+    body = pkt[16:]
+    if xdm_hdr[1] == 0xB0C0:
+        decoder = diagstructs.LTE_RRC_OTA.decoders[body[0]]
+        return decoder.unpack_from(body), body[decoder.size:]
+    elif xdm_hdr[1] == 0xB0EC:
+        return body[4:]
+    elif xdm_hdr[1] == 0xB17F:
+        decoder = diagstructs.LTE_ML1_SCELL_MEAS.decoders[body[0]]
+        rrc_rel, earfcn, pci, meas_rsrp, meas_rsrq, meas_rssi = decoder.unpack_from(body)
+        q_qual_min = diagstructs.LTE_ML1_SCELL_MEAS_R9.decoders[body[0]].unpack_from(body, decoder.size)[0]
+        return earfcn, pci, meas_rsrp, meas_rsrq, meas_rssi, q_qual_min
+    elif xdm_hdr[1] == 0xB180:
+        decoder = diagstructs.LTE_ML1_NCELL_MEAS.decoders[body[0]]
+        rrc_rel, earfcn, n_cells = decoder.unpack_from(body)
+        cell_decoder = diagstructs.LTE_ML1_NCELL_MEAS_CELL.decoders[body[0]]
+        return earfcn, cell_decoder.iter_unpack(body[decoder.size:decoder.size + cell_decoder.size * n_cells])
+
+def per_packet_ns(func, pkt, number):
+    return min(timeit.repeat(lambda: func(pkt), number=number, repeat=5)) / number * 1e9
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Microbenchmark of Qualcomm log packet decoding')
+    parser.add_argument('-n', '--number', help='Iterations per measurement', type=int, default=100000)
+    args = parser.parse_args()
+
+    qc_parser = parsers.QualcommParser()
+    qc_parser.set_writer(writers.NullWriter())
+    qc_parser.set_parameter({'log_level': 100})
+
+    print('{:8s} {:>10s} {:>10s} {:>8s} {:>10s}'.format('Log code', 'old (ns)', 'new (ns)', 'speedup', 'full (ns)'))
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        results = []
+        for log_id, pkt in SAMPLES.items():
+            view = memoryview(pkt)
+            assert decode_old(pkt) == decode_new(view)
+            old_ns = per_packet_ns(decode_old, pkt, args.number)
+            new_ns = per_packet_ns(decode_new, view, args.number)
+            full_ns = per_packet_ns(qc_parser.parse_diag_log, view, args.number // 10)
+            results.append((log_id, old_ns, new_ns, full_ns))
+
+    for log_id, old_ns, new_ns, full_ns in results:
+        print('0x{:04X}   {:10.1f} {:10.1f} {:7.2f}x {:10.1f}'.format(log_id, old_ns, new_ns, old_ns / new_ns, full_ns))
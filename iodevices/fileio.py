@@ -1,20 +1,167 @@
 #!/usr/bin/env python3
 # coding: utf8
 
-import gzip, bz2
+import gzip, bz2, lzma
+import mmap
+import queue
+import threading
 import util
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# Leading bytes of the compressed formats, checked in order
+CODEC_MAGIC = [
+    ('gzip', b'\x1f\x8b'),
+    ('bzip2', b'BZh'),
+    ('xz', b'\xfd7zXZ\x00'),
+    ('zstd', b'\x28\xb5\x2f\xfd'),
+    ('lz4', b'\x04\x22\x4d\x18'),
+]
+
+def detect_codec(magic):
+    for codec, prefix in CODEC_MAGIC:
+        if magic.startswith(prefix):
+            return codec
+
+    # Legacy .lzma has no magic: default properties byte 0x5d followed by
+    # a power of two dictionary size, as written by xz and lzma
+    if len(magic) >= 5 and magic[0] == 0x5d:
+        dict_size = int.from_bytes(magic[1:5], 'little')
+        if dict_size >= 0x1000 and dict_size & (dict_size - 1) == 0:
+            return 'lzma'
+    return None
+
+def open_codec(codec, f):
+    if codec == 'gzip':
+        return gzip.GzipFile(fileobj = f, mode = 'rb')
+    elif codec == 'bzip2':
+        return bz2.BZ2File(f, 'rb')
+    elif codec == 'xz':
+        return lzma.LZMAFile(f, 'rb', format = lzma.FORMAT_XZ)
+    elif codec == 'lzma':
+        return lzma.LZMAFile(f, 'rb', format = lzma.FORMAT_ALONE)
+    elif codec == 'zstd':
+        if zstandard is None:
+            raise ValueError('zstd compressed dump requires the zstandard module')
+        return zstandard.ZstdDecompressor().stream_reader(f)
+    elif codec == 'lz4':
+        if lz4 is None:
+            raise ValueError('lz4 compressed dump requires the lz4 module')
+        return lz4.frame.LZ4FrameFile(f, 'rb')
+    raise ValueError('Unknown codec {}'.format(codec))
+
+class ChunkReader:
+    # Decompresses on a producer thread into a bounded queue of large
+    # chunks, so that decompression overlaps with parsing (the codecs
+    # release the GIL). read() returns memoryview slices of the chunks and
+    # never crosses a chunk boundary.
+
+    def __init__(self, f, chunk_size = 0x400000, depth = 4):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.queue = queue.Queue(depth)
+        self.stop = threading.Event()
+        self.chunk = memoryview(b'')
+        self.pos = 0
+        self.eof = False
+
+        self.thread = threading.Thread(target = self.produce, name = 'scat-decompress', daemon = True)
+        self.thread.start()
+
+    def produce(self):
+        try:
+            while not self.stop.is_set():
+                chunk = self.f.read(self.chunk_size)
+                self.put(chunk)
+                if len(chunk) == 0:
+                    return
+        except Exception as e:
+            # Raised on the reading side
+            self.put(e)
+
+    def put(self, item):
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout = 0.1)
+                return
+            except queue.Full:
+                continue
+
+    def read(self, read_size):
+        while self.pos >= len(self.chunk):
+            if self.eof:
+                return b''
+            item = self.queue.get()
+            if isinstance(item, Exception):
+                self.eof = True
+                raise item
+            if len(item) == 0:
+                self.eof = True
+                return b''
+            self.chunk = memoryview(item)
+            self.pos = 0
+
+        buf = self.chunk[self.pos:self.pos + read_size]
+        self.pos += len(buf)
+        return buf
+
+    def close(self):
+        self.stop.set()
+        self.thread.join()
+        self.f.close()
+
 class FileIO:
-    def _open_file(self, fname):
+    # Uncompressed dumps are mapped into memory: read() then returns
+    # memoryview slices of the mapping instead of copies, and parsers may
+    # step back over a partial trailing frame with rewind() instead of
+    # concatenating it with the next chunk. Compressed dumps, recognized by
+    # their magic bytes, are decompressed by a ChunkReader.
+
+    def _close_file(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+        if self.view is not None:
+            try:
+                self.view.release()
+                self.map.close()
+            except BufferError:
+                # Slices still referenced, unmapped once they are collected
+                pass
+            self.view = None
+            self.map = None
         if self.f:
             self.f.close()
 
-        if fname.find('.gz') > 0:
-            self.f = gzip.open(fname, 'rb')
-        elif fname.find('.bz2') > 0:
-            self.f = bz2.open(fname, 'rb')
+    def _open_file(self, fname):
+        self._close_file()
+
+        self.f = open(fname, 'rb')
+        self.codec = detect_codec(self.f.peek(8)[:8])
+        if self.codec is None:
+            self._map_file()
         else:
-            self.f = open(fname, 'rb')
+            self.reader = ChunkReader(open_codec(self.codec, self.f))
+
+    def _map_file(self):
+        try:
+            self.map = mmap.mmap(self.f.fileno(), 0, access = mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # Empty file or not mappable (e.g. a pipe), read as a stream
+            return
+        if hasattr(self.map, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            # Aggressive readahead, pages behind the read position may be dropped
+            self.map.madvise(mmap.MADV_SEQUENTIAL)
+        self.view = memoryview(self.map)
+        self.pos = 0
 
     def __init__(self, fnames):
         self.fnames = fnames[:]
@@ -22,21 +169,56 @@ class FileIO:
         self.fname = ''
         self.file_available = True
         self.f = None
+        self.codec = None
+        self.reader = None
+        self.map = None
+        self.view = None
+        self.pos = 0
         self.block_until_data = False
 
+        # Counters for the metrics endpoint
+        self.read_bytes = 0
+        self.read_count = 0
+        self.read_errors = 0
+        self.write_bytes = 0
+
         self.open_next_file()
 
     def read(self, read_size, decode_hdlc = False):
+        if self.view is not None:
+            buf = self.view[self.pos:self.pos + read_size]
+            self.pos += len(buf)
+            self.read_bytes += len(buf)
+            if len(buf) > 0:
+                self.read_count += 1
+            if decode_hdlc:
+                buf = util.unwrap(bytes(buf))
+            return buf
+
         buf = b''
         try:
-            buf = self.f.read(read_size)
-            buf = bytes(buf)
+            if self.reader is not None:
+                buf = self.reader.read(read_size)
+            else:
+                buf = bytes(self.f.read(read_size))
         except:
+            self.read_errors += 1
             return b''
+        self.read_bytes += len(buf)
+        if len(buf) > 0:
+            self.read_count += 1
         if decode_hdlc:
             buf = util.unwrap(write_buf)
         return buf
 
+    def rewind(self, length):
+        # Steps back over the last length bytes read, mapped files only
+        if self.view is None or length > self.pos:
+            return False
+        self.pos -= length
+        self.read_bytes -= length
+        return True
+
     def open_next_file(self):
         try:
             self.fname = self.fnames.pop()
@@ -53,5 +235,4 @@ class FileIO:
         self.read(read_size)
         
     def __exit__(self, exc_type, exc_value, traceback):
-        if self.f:
-            self.f.close()
+        self._close_file()
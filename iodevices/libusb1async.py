@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# coding: utf8
+
+import ctypes
+import ctypes.util
+
+# Asynchronous bulk-IN transfers through the libusb-1.0 C API
+# pyusb only offers synchronous reads, i.e. a single outstanding transfer.
+# This backend keeps a fixed number of transfers queued on the IN endpoint,
+# resubmits each one from its completion callback and hands the completed
+# buffers to a consumer callback in submission order.
+#
+# A backend is used by USBIO.start_reader() through:
+#   submit(count, size, callback) - queue transfers, callback(data) per buffer,
+#       data None for a failed transfer whose data is lost
+#   handle_events(timeout) - run completions for up to timeout seconds
+#   retry() - resubmit transfers whose resubmission failed
+#   write(data, timeout) - synchronous bulk-OUT transfer
+#   close() - cancel transfers and release the device
+# Any AsyncBackend implementing these can replace it, e.g. a fake without
+# hardware (see tests/test_usbasync.py).
+
+LIBUSB_TRANSFER_TYPE_BULK = 2
+
+LIBUSB_TRANSFER_COMPLETED = 0
+LIBUSB_TRANSFER_ERROR = 1
+LIBUSB_TRANSFER_TIMED_OUT = 2
+LIBUSB_TRANSFER_CANCELLED = 3
+LIBUSB_TRANSFER_STALL = 4
+LIBUSB_TRANSFER_NO_DEVICE = 5
+LIBUSB_TRANSFER_OVERFLOW = 6
+
+class libusb_transfer(ctypes.Structure):
+    pass
+
+libusb_transfer_cb_fn = ctypes.CFUNCTYPE(None, ctypes.POINTER(libusb_transfer))
+
+libusb_transfer._fields_ = [
+    ('dev_handle', ctypes.c_void_p),
+    ('flags', ctypes.c_uint8),
+    ('endpoint', ctypes.c_ubyte),
+    ('type', ctypes.c_ubyte),
+    ('timeout', ctypes.c_uint),
+    ('status', ctypes.c_int),
+    ('length', ctypes.c_int),
+    ('actual_length', ctypes.c_int),
+    ('callback', libusb_transfer_cb_fn),
+    ('user_data', ctypes.c_void_p),
+    ('buffer', ctypes.c_void_p),
+    ('num_iso_packets', ctypes.c_int),
+]
+
+class libusb_device_descriptor(ctypes.Structure):
+    _fields_ = [
+        ('bLength', ctypes.c_uint8),
+        ('bDescriptorType', ctypes.c_uint8),
+        ('bcdUSB', ctypes.c_uint16),
+        ('bDeviceClass', ctypes.c_uint8),
+        ('bDeviceSubClass', ctypes.c_uint8),
+        ('bDeviceProtocol', ctypes.c_uint8),
+        ('bMaxPacketSize0', ctypes.c_uint8),
+        ('idVendor', ctypes.c_uint16),
+        ('idProduct', ctypes.c_uint16),
+        ('bcdDevice', ctypes.c_uint16),
+        ('iManufacturer', ctypes.c_uint8),
+        ('iProduct', ctypes.c_uint8),
+        ('iSerialNumber', ctypes.c_uint8),
+        ('bNumConfigurations', ctypes.c_uint8),
+    ]
+
+class timeval(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_usec', ctypes.c_long)]
+
+_lib = None
+
+def load_libusb1():
+    global _lib
+    if _lib is not None:
+        return _lib
+
+    name = ctypes.util.find_library('usb-1.0') or ctypes.util.find_library('libusb-1.0')
+    if name is None:
+        raise OSError('libusb-1.0 not found')
+    lib = ctypes.CDLL(name)
+
+    lib.libusb_init.argtypes = [ctypes.POINTER(ctypes.c_void_p)]
+    lib.libusb_exit.argtypes = [ctypes.c_void_p]
+    lib.libusb_exit.restype = None
+    lib.libusb_get_device_list.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.POINTER(ctypes.c_void_p))]
+    lib.libusb_get_device_list.restype = ctypes.c_ssize_t
+    lib.libusb_free_device_list.argtypes = [ctypes.POINTER(ctypes.c_void_p), ctypes.c_int]
+    lib.libusb_free_device_list.restype = None
+    lib.libusb_get_bus_number.argtypes = [ctypes.c_void_p]
+    lib.libusb_get_bus_number.restype = ctypes.c_uint8
+    lib.libusb_get_device_address.argtypes = [ctypes.c_void_p]
+    lib.libusb_get_device_address.restype = ctypes.c_uint8
+    lib.libusb_get_device_descriptor.argtypes = [ctypes.c_void_p, ctypes.POINTER(libusb_device_descriptor)]
+    lib.libusb_open.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_void_p)]
+    lib.libusb_close.argtypes = [ctypes.c_void_p]
+    lib.libusb_close.restype = None
+    lib.libusb_set_auto_detach_kernel_driver.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    lib.libusb_claim_interface.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    lib.libusb_release_interface.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    lib.libusb_alloc_transfer.argtypes = [ctypes.c_int]
+    lib.libusb_alloc_transfer.restype = ctypes.POINTER(libusb_transfer)
+    lib.libusb_free_transfer.argtypes = [ctypes.POINTER(libusb_transfer)]
+    lib.libusb_free_transfer.restype = None
+    lib.libusb_submit_transfer.argtypes = [ctypes.POINTER(libusb_transfer)]
+    lib.libusb_cancel_transfer.argtypes = [ctypes.POINTER(libusb_transfer)]
+    lib.libusb_handle_events_timeout_completed.argtypes = [ctypes.c_void_p, ctypes.POINTER(timeval), ctypes.POINTER(ctypes.c_int)]
+    lib.libusb_bulk_transfer.argtypes = [ctypes.c_void_p, ctypes.c_ubyte, ctypes.c_void_p, ctypes.c_int, ctypes.POINTER(ctypes.c_int), ctypes.c_uint]
+    lib.libusb_error_name.argtypes = [ctypes.c_int]
+    lib.libusb_error_name.restype = ctypes.c_char_p
+
+    _lib = lib
+    return lib
+
+class Libusb1Error(IOError):
+    def __init__(self, func, ret):
+        self.ret = ret
+        super().__init__('{} failed: {}'.format(func, _lib.libusb_error_name(ret).decode() if _lib else ret))
+
+class AsyncBackend:
+    # Submission order bookkeeping shared by the backends: queued() is
+    # called for each submitted transfer, done() for each completion, in
+    # any order. Completed buffers are passed to callback(data) in
+    # submission order. Transfers failing to resubmit are kept in pending
+    # for retry(), the backend's resubmit(index) adds them.
+
+    def __init__(self):
+        self.callback = None
+        self.active = 0
+        self.stopping = False
+        self.errors = 0
+        self.no_device = False
+
+        self.next_seq = 0
+        self.deliver_seq = 0
+        self.seqs = { }
+        self.completed = { }
+        self.pending = []
+
+    def queued(self, index):
+        self.seqs[index] = self.next_seq
+        self.next_seq += 1
+        self.active += 1
+
+    def done(self, index, data):
+        self.active -= 1
+        self.completed[self.seqs.pop(index)] = data
+        while self.deliver_seq in self.completed:
+            data = self.completed.pop(self.deliver_seq)
+            self.deliver_seq += 1
+            if data is None or len(data) > 0:
+                self.callback(data)
+
+    def retry(self):
+        pending = self.pending
+        self.pending = []
+        for index in pending:
+            self.resubmit(index)
+
+class Libusb1AsyncBackend(AsyncBackend):
+    def __init__(self, bus, address, interface, ep_in, ep_out):
+        super().__init__()
+        self.lib = load_libusb1()
+        self.interface = interface
+        self.ep_in = ep_in
+        self.ep_out = ep_out
+
+        self.ctx = ctypes.c_void_p()
+        self.handle = ctypes.c_void_p()
+        self.transfers = []
+        self.buffers = []
+
+        self.check('libusb_init', self.lib.libusb_init(ctypes.byref(self.ctx)))
+        try:
+            self.open(bus, address)
+        except:
+            self.lib.libusb_exit(self.ctx)
+            raise
+
+        # Keep the callback object alive as long as transfers may call it
+        self.callback_fn = libusb_transfer_cb_fn(self.transfer_done)
+
+    def check(self, func, ret):
+        if ret < 0:
+            raise Libusb1Error(func, ret)
+        return ret
+
+    def open(self, bus, address):
+        dev_list = ctypes.POINTER(ctypes.c_void_p)()
+        count = self.check('libusb_get_device_list', self.lib.libusb_get_device_list(self.ctx, ctypes.byref(dev_list)))
+        try:
+            for i in range(count):
+                dev = dev_list[i]
+                if self.lib.libusb_get_bus_number(dev) == bus and self.lib.libusb_get_device_address(dev) == address:
+                    self.check('libusb_open', self.lib.libusb_open(dev, ctypes.byref(self.handle)))
+                    break
+            else:
+                raise ValueError('Device not found')
+        finally:
+            self.lib.libusb_free_device_list(dev_list, 1)
+
+        # Not supported on all platforms
+        self.lib.libusb_set_auto_detach_kernel_driver(self.handle, 1)
+        try:
+            self.check('libusb_claim_interface', self.lib.libusb_claim_interface(self.handle, self.interface))
+        except:
+            self.lib.libusb_close(self.handle)
+            raise
+
+    def submit(self, count, size, callback):
+        self.callback = callback
+        for i in range(count):
+            transfer = self.lib.libusb_alloc_transfer(0)
+            if not transfer:
+                raise MemoryError('libusb_alloc_transfer failed')
+            buf = (ctypes.c_ubyte * size)()
+            t = transfer.contents
+            t.dev_handle = self.handle.value
+            t.endpoint = self.ep_in
+            t.type = LIBUSB_TRANSFER_TYPE_BULK
+            t.timeout = 0
+            t.length = size
+            t.callback = self.callback_fn
+            t.user_data = i
+            t.buffer = ctypes.cast(buf, ctypes.c_void_p)
+            self.transfers.append(transfer)
+            self.buffers.append(buf)
+            ret = self.resubmit(i)
+        if self.active == 0:
+            raise Libusb1Error('libusb_submit_transfer', ret)
+
+    def resubmit(self, index):
+        ret = self.lib.libusb_submit_transfer(self.transfers[index])
+        if ret < 0:
+            self.errors += 1
+            self.pending.append(index)
+            return ret
+        self.queued(index)
+        return ret
+
+    def transfer_done(self, transfer_p):
+        t = transfer_p.contents
+        index = t.user_data or 0
+
+        data = b''
+        if t.status == LIBUSB_TRANSFER_COMPLETED or t.status == LIBUSB_TRANSFER_TIMED_OUT:
+            data = ctypes.string_at(t.buffer, t.actual_length)
+        elif t.status == LIBUSB_TRANSFER_NO_DEVICE:
+            self.no_device = True
+        elif t.status != LIBUSB_TRANSFER_CANCELLED:
+            # Whatever the device sent with this transfer is lost
+            self.errors += 1
+            data = None
+        self.done(index, data)
+
+        if not (self.stopping or self.no_device):
+            self.resubmit(index)
+
+    def handle_events(self, timeout):
+        tv = timeval(int(timeout), int((timeout % 1) * 1000000))
+        self.check('libusb_handle_events_timeout_completed',
+            self.lib.libusb_handle_events_timeout_completed(self.ctx, ctypes.byref(tv), None))
+
+    def write(self, data, timeout = 1000):
+        buf = ctypes.create_string_buffer(bytes(data), len(data))
+        transferred = ctypes.c_int()
+        self.check('libusb_bulk_transfer', self.lib.libusb_bulk_transfer(self.handle, self.ep_out,
+            buf, len(data), ctypes.byref(transferred), timeout))
+        return transferred.value
+
+    def close(self):
+        self.stopping = True
+        for index in list(self.seqs.keys()):
+            self.lib.libusb_cancel_transfer(self.transfers[index])
+        while self.active > 0:
+            self.handle_events(0.1)
+        for transfer in self.transfers:
+            self.lib.libusb_free_transfer(transfer)
+        self.transfers = []
+        self.buffers = []
+
+        self.lib.libusb_release_interface(self.handle, self.interface)
+        self.lib.libusb_close(self.handle)
+        self.lib.libusb_exit(self.ctx)
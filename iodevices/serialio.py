@@ -9,13 +9,29 @@ class SerialIO:
         self.port = serial.Serial(port_name, baudrate=921600, timeout=0.5)#, rtscts=True, dsrdtr=True)
         self.block_until_data = True
 
+        # Counters for the metrics endpoint
+        self.read_bytes = 0
+        self.read_count = 0
+        self.read_errors = 0
+        self.read_timeouts = 0
+        self.write_bytes = 0
+
     def __enter__(self):
         return self
 
     def read(self, read_size, decode_hdlc = False):
-        buf = b''
-        buf = self.port.read(read_size)
+        # Wait up to the port timeout for the first byte, then take whatever
+        # else is already buffered instead of waiting for read_size bytes
+        buf = self.port.read(1)
+        if len(buf) == 0:
+            self.read_timeouts += 1
+            return b''
+        pending = self.port.in_waiting
+        if pending > 0 and read_size > 1:
+            buf += self.port.read(min(pending, read_size - 1))
         buf = bytes(buf)
+        self.read_bytes += len(buf)
+        self.read_count += 1
         if decode_hdlc:
             buf = util.unwrap(write_buf)
         return buf
@@ -24,6 +40,7 @@ class SerialIO:
         if encode_hdlc:
             write_buf = util.wrap(write_buf)
         self.port.write(write_buf)
+        self.write_bytes += len(write_buf)
 
     def write_then_read_discard(self, write_buf, read_size = 0x1000, encode_hdlc = False):
         self.write(write_buf, encode_hdlc)
@@ -3,22 +3,226 @@
 
 import usb
 import util
+from .libusb1async import Libusb1AsyncBackend
+
+import array
+import collections
+import logging
+import threading
+
+# Older pyusb raises a plain USBError with errno ETIMEDOUT
+usb_timeout_error = getattr(usb.core, 'USBTimeoutError', ())
+
+def is_usb_timeout(e):
+    return isinstance(e, usb_timeout_error) or e.errno == 110
 
 class USBIO:
     def __init__(self):
         self.usb_dev = None
         self.block_until_data = True
 
+        # Counters for the metrics endpoint
+        self.read_bytes = 0
+        self.read_count = 0
+        self.read_errors = 0
+        self.read_timeouts = 0
+        self.write_bytes = 0
+
+        # Blocking read timeout in ms, read() returns no data after it
+        self.read_timeout = 1000
+
+        self.logger = logging.getLogger('scat.usbio')
+
+        # Background reader (start_reader()): single producer, single
+        # consumer ring. Only the reader thread advances ring_wr and only
+        # read() advances ring_rd, both count bytes since start.
+        self.reader_thread = None
+        self.reader_stop = threading.Event()
+        self.ring_data = threading.Event()
+        self.ring = None
+        self.ring_rd = 0
+        self.ring_wr = 0
+        self.ring_high_water = 0
+        self.ring_above_high_water = False
+        self.ring_peak = 0
+        self.overruns = 0
+        self.overrun_bytes = 0
+        # Ring positions where transfers were dropped: read() does not return
+        # data across them and sets read_gap on the first read after one
+        self.ring_gaps = collections.deque()
+        self.ring_last_gap = None
+        self.read_gap = False
+
+        # Asynchronous transfers (start_reader(transfers > 0)), takes over
+        # the DM interface from pyusb until stop_reader()
+        self.backend = None
+
     def __enter__(self):
         return self
 
+    def start_reader(self, capacity = 0x400000, high_water = 0.75, transfer_size = 0x4000, timeout = 100,
+            transfers = 0, backend = None):
+        # Keeps a bulk-IN transfer outstanding while the parser is busy, or
+        # with transfers > 0 that many through the asynchronous backend
+        self.ring = bytearray(capacity)
+        self.ring_rd = 0
+        self.ring_wr = 0
+        self.ring_gaps.clear()
+        self.ring_last_gap = None
+        self.ring_high_water = int(capacity * high_water)
+        self.reader_stop.clear()
+
+        if transfers > 0:
+            if backend is None:
+                usb.util.dispose_resources(self.dev)
+                backend = Libusb1AsyncBackend(self.dev.bus, self.dev.address,
+                    self.intf.bInterfaceNumber, self.r_handle.bEndpointAddress, self.w_handle.bEndpointAddress)
+            try:
+                backend.submit(transfers, transfer_size, self.async_done)
+            except:
+                backend.close()
+                raise
+            self.backend = backend
+            target = self.async_loop
+        else:
+            target = self.reader_loop
+
+        self.reader_thread = threading.Thread(target = target,
+            args = (transfer_size, timeout), name = 'scat-usb-reader', daemon = True)
+        self.reader_thread.start()
+
+    def stop_reader(self):
+        if self.reader_thread is not None:
+            self.reader_stop.set()
+            self.reader_thread.join()
+            self.reader_thread = None
+        if self.backend is not None:
+            self.backend.close()
+            self.backend = None
+
+    def async_loop(self, transfer_size, timeout):
+        errors = 0
+        while not self.reader_stop.is_set():
+            try:
+                self.backend.handle_events(timeout / 1000)
+            except IOError:
+                self.read_errors += 1
+                self.reader_stop.wait(0.1)
+            if self.backend.errors != errors:
+                self.read_errors += self.backend.errors - errors
+                errors = self.backend.errors
+            if self.backend.no_device:
+                self.logger.log(logging.ERROR, 'USB device disconnected')
+                break
+            if len(self.backend.pending) > 0:
+                self.backend.retry()
+                if self.backend.active == 0:
+                    self.logger.log(logging.ERROR, 'No USB transfer could be resubmitted, stopping the reader')
+                    break
+
+    def async_done(self, data):
+        # Completed transfers, in submission order, None for a failed one
+        if data is None:
+            self.ring_mark_gap()
+            return
+        self.read_bytes += len(data)
+        self.read_count += 1
+        self.ring_put(data)
+
+    def reader_loop(self, transfer_size, timeout):
+        transfer = array.array('B', bytes(transfer_size))
+        while not self.reader_stop.is_set():
+            try:
+                length = self.r_handle.read(transfer, timeout)
+            except usb.core.USBError as e:
+                if is_usb_timeout(e):
+                    continue
+                self.read_errors += 1
+                self.reader_stop.wait(0.1)
+                continue
+            if length > 0:
+                self.read_bytes += length
+                self.read_count += 1
+                self.ring_put(memoryview(transfer)[:length])
+
+    def ring_put(self, data):
+        capacity = len(self.ring)
+        length = len(data)
+        fill = self.ring_wr - self.ring_rd
+        if fill + length > capacity:
+            # Parser too slow: drop the transfer and mark the gap, the
+            # consumer discards the frame spanning it
+            self.overruns += 1
+            self.overrun_bytes += length
+            self.ring_mark_gap()
+            return
+
+        pos = self.ring_wr % capacity
+        first = min(length, capacity - pos)
+        self.ring[pos:pos + first] = data[:first]
+        if first < length:
+            self.ring[0:length - first] = data[first:]
+        self.ring_wr += length
+        self.ring_data.set()
+
+        fill += length
+        if fill > self.ring_peak:
+            self.ring_peak = fill
+        if fill > self.ring_high_water and not self.ring_above_high_water:
+            self.ring_above_high_water = True
+            self.logger.log(logging.WARNING, 'USB read buffer above high water mark: {} of {} bytes'.format(fill, capacity))
+        elif fill < self.ring_high_water // 2:
+            self.ring_above_high_water = False
+
+    def ring_mark_gap(self):
+        # Data between ring_wr and the next write was lost, reader thread only
+        if self.ring_last_gap != self.ring_wr:
+            self.ring_last_gap = self.ring_wr
+            self.ring_gaps.append(self.ring_wr)
+
+    def ring_get(self, read_size, timeout):
+        self.read_gap = False
+        if self.ring_wr == self.ring_rd:
+            self.ring_data.clear()
+            # Re-check after clearing, the reader sets the event after ring_wr
+            if self.ring_wr == self.ring_rd and not self.ring_data.wait(timeout):
+                return b''
+
+        if len(self.ring_gaps) > 0 and self.ring_gaps[0] == self.ring_rd:
+            self.ring_gaps.popleft()
+            self.read_gap = True
+
+        capacity = len(self.ring)
+        length = min(read_size, self.ring_wr - self.ring_rd)
+        if len(self.ring_gaps) > 0:
+            length = min(length, self.ring_gaps[0] - self.ring_rd)
+        pos = self.ring_rd % capacity
+        first = min(length, capacity - pos)
+        buf = bytes(self.ring[pos:pos + first])
+        if first < length:
+            buf += self.ring[0:length - first]
+        self.ring_rd += length
+        return buf
+
     def read(self, read_size, decode_hdlc = False):
+        if self.reader_thread is not None:
+            buf = self.ring_get(read_size, self.read_timeout / 1000)
+            if decode_hdlc:
+                buf = util.unwrap(buf)
+            return buf
+
         buf = b''
         try:
-            buf = self.r_handle.read(read_size)
+            buf = self.r_handle.read(read_size, self.read_timeout)
             buf = bytes(buf)
-        except usb.core.USBError:
+        except usb.core.USBError as e:
+            if is_usb_timeout(e):
+                self.read_timeouts += 1
+            else:
+                self.read_errors += 1
             return b''
+        self.read_bytes += len(buf)
+        self.read_count += 1
         if decode_hdlc:
             buf = util.unwrap(write_buf)
         return buf
@@ -26,7 +230,11 @@ class USBIO:
     def write(self, write_buf, encode_hdlc = False):
         if encode_hdlc:
             write_buf = util.wrap(write_buf)
-        self.w_handle.write(write_buf)
+        if self.backend is not None:
+            self.backend.write(write_buf)
+        else:
+            self.w_handle.write(write_buf)
+        self.write_bytes += len(write_buf)
 
     def write_then_read_discard(self, write_buf, read_size = 0x1000, encode_hdlc = False):
         self.write(write_buf, encode_hdlc)
@@ -75,5 +283,6 @@ class USBIO:
         self.dev.set_configuration(config)
 
     def __exit__(self, exc_type, exc_value, traceback):
+        self.stop_reader()
         if self.usb_dev is not None:
             usb.util.dispose_resources(self.usb_dev)
@@ -1,33 +1,37 @@
 #!/usr/bin/env python3
 
 from . import diagcmd
+from . import diagstructs
 import util
 
 import struct
 import calendar, datetime
 import logging
+import functools
 
 class Diag1xLogParser:
     def __init__(self, parent):
         self.parent = parent
 
+        # Segments of incomplete IP packets, oldest dropped beyond the limit
         self.pending_pkts = dict()
+        self.max_pending_pkts = 256
 
         self.last_tx = [b'', b'']
         self.last_rx = [b'', b'']
 
         self.process = {
             # SIM
-            #0x1098: lambda x, y, z: self.parse_sim(x, y, z, 0), # RUIM Debug
-            #0x14CE: lambda x, y, z: self.parse_sim(x, y, z, 1), # UIM DS Data
+            #0x1098: functools.partial(self.parse_sim, sim_id = 0), # RUIM Debug
+            #0x14CE: functools.partial(self.parse_sim, sim_id = 1), # UIM DS Data
 
             # Generic
-            0x11EB: lambda x, y, z: self.parse_ip(x, y, z), # Protocol Services Data
+            0x11EB: self.parse_ip, # Protocol Services Data
         }
 
     def parse_ip(self, pkt_ts, pkt, radio_id):
         # instance, protocol, ifname, R, FBit, Direction, LBit, seqn, segn, fin_seg, data
-        proto_hdr = struct.unpack('<BBBBHH', pkt[0:8])
+        proto_hdr = diagstructs.LOG_1X_IP_HEADER.unpack_from(pkt, 0)
         # pkt[0] = instance
         # pkt[1] = protocol (0x01 = IP)
         # pkt[2] = ifnameid
@@ -47,11 +51,11 @@ class Diag1xLogParser:
         pkt_id = (ifname_id, is_tx, seqn)
         if is_fin:
             if segn == 0:
-                self.parent.writer.write_up(proto_data, radio_id, pkt_ts)
+                self.parent.writer.write_up(bytes(proto_data), radio_id, pkt_ts)
                 return
             else:
                 if not (pkt_id in self.pending_pkts.keys()):
-                    self.parent.writer.write_up(proto_data, radio_id, pkt_ts)
+                    self.parent.writer.write_up(bytes(proto_data), radio_id, pkt_ts)
                     return
                 pending_pkt = self.pending_pkts.get(pkt_id)
                 for x in range(segn):
@@ -64,13 +68,22 @@ class Diag1xLogParser:
                 self.parent.writer.write_up(pkt_buf, radio_id, pkt_ts)
         else:
             if pkt_id in self.pending_pkts.keys():
-                self.pending_pkts[pkt_id][segn] = proto_data
+                self.pending_pkts[pkt_id][segn] = bytes(proto_data)
             else:
-                self.pending_pkts[pkt_id] = {segn: proto_data}
+                if len(self.pending_pkts) >= self.max_pending_pkts:
+                    stale_id = next(iter(self.pending_pkts))
+                    del self.pending_pkts[stale_id]
+                    self.parent.logger.log(logging.WARNING, "Warning: dropping incomplete data packet (%d, %s, %d)" % stale_id)
+                self.pending_pkts[pkt_id] = {segn: bytes(proto_data)}
+
+    def get_memory_usage(self):
+        return {
+            '1x pending IP segments': sum(len(y) for x in list(self.pending_pkts.values()) for y in list(x.values())),
+            '1x SIM APDU buffers': sum(len(x) for x in self.last_tx + self.last_rx),
+        }
 
     def parse_sim(self, pkt_ts, pkt, radio_id, sim_id):
-        ts_sec = calendar.timegm(pkt_ts.timetuple())
-        ts_usec = pkt_ts.microsecond
+        ts_sec, ts_usec = util.ts_to_sec_usec(pkt_ts)
 
         msg_content = pkt
         # msg[0]: length
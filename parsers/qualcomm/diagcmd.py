@@ -11,6 +11,7 @@ DIAG_EVENT_REPORT_F = 0x60   # Static Event reporting
 DIAG_LOG_CONFIG_F = 0x73     # Logging configuration packet
 DIAG_EXT_MSG_F = 0x79        # Request for extended message report
 DIAG_EXT_MSG_CONFIG_F = 0x7d # Request for Extended message report
+DIAG_EVENT_MASK_SET_F = 0x82 # Set event mask
 DIAG_QSR_EXT_MSG_TERSE_F = 0x92  # QSR extended messages
 DIAG_QSR4_EXT_MSG_TERSE_F = 0x99 # QSR4 extended messages
 DIAG_MULTI_RADIO_CMD_F = 0x98    # Found on newer dual SIMs
@@ -310,9 +311,66 @@ def create_extended_message_config_set_mask(first_ssid, last_ssid, *masks):
         first_ssid, last_ssid, 0x00)
     ext_msg_config_mask_payload = bytearray(b'\x00\x00\x00\x00' * (last_ssid - first_ssid + 1))
 
-    # Each subsystem ID has own log level
-    # Currently Extended messages are not parsed so do nothing
-    for mask in masks:
-        pass
+    # Each subsystem ID has own log level, masks are given from first_ssid on
+    for i, mask in enumerate(masks[:last_ssid - first_ssid + 1]):
+        struct.pack_into('<L', ext_msg_config_mask_payload, 4 * i, mask)
 
     return diag_log_config_mask_header + bytes(ext_msg_config_mask_payload)
+
+def create_event_mask_set(last_id, *event_ids):
+    # Command ID, status, padding, number of bits | bitfields
+    event_mask_header = struct.pack('<BBHH', DIAG_EVENT_MASK_SET_F, 0x00, 0x0000, last_id + 1)
+    event_mask_payload = bytearray(b'\x00' * bytes_reqd_for_bit(last_id + 1))
+
+    for event_id in event_ids:
+        if event_id > last_id:
+            print("Event %d is outside of maximal events" % (event_id))
+            continue
+        event_mask_payload[event_id // 8] |= (1 << (event_id % 8))
+
+    return event_mask_header + bytes(event_mask_payload)
+
+# Log masks generated from a list of log codes (--log-codes)
+# Last item per equipment ID as used by the preferred masks
+log_mask_last_item = {
+    DIAG_SUBSYS_ID_1X: 0x0847,
+    DIAG_SUBSYS_ID_WCDMA: 0x0ff7,
+    DIAG_SUBSYS_ID_GSM: 0x0ff7,
+    DIAG_SUBSYS_ID_UMTS: 0x0b5e,
+    DIAG_SUBSYS_ID_DTV: 0x0392,
+    DIAG_SUBSYS_ID_LTE: 0x0209,
+    DIAG_SUBSYS_ID_TDSCDMA: 0x0207,
+}
+
+def log_mask_from_codes(equip_id, log_codes):
+    # log_codes are full 16-bit log codes, equipment ID in the upper 4 bits
+    return create_log_config_set_mask(equip_id, log_mask_last_item[equip_id],
+        *sorted(x & 0xfff for x in log_codes if (x >> 12) == equip_id))
+
+def parse_log_code_list(lines):
+    # One entry per line, '#' starts a comment:
+    #   [log] 0xB0C0       log code
+    #   event 1605         event ID
+    #   ssid 0x1388        extended message subsystem ID
+    # Values may be ranges, e.g. "log 0xB0E2-0xB0ED"
+    log_codes = set()
+    event_ids = set()
+    ssids = set()
+    targets = {'log': log_codes, 'event': event_ids, 'ssid': ssids}
+
+    for line_number, line in enumerate(lines, 1):
+        line = line.split('#', 1)[0].split()
+        if len(line) == 0:
+            continue
+        if len(line) == 1:
+            line = ['log'] + line
+        if len(line) != 2 or not (line[0] in targets.keys()):
+            raise ValueError('Line {}: expected "[log|event|ssid] value"'.format(line_number))
+
+        try:
+            values = [int(x, 0) for x in line[1].split('-', 1)]
+        except ValueError:
+            raise ValueError('Line {}: invalid value {}'.format(line_number, line[1]))
+        targets[line[0]].update(range(values[0], values[-1] + 1))
+
+    return log_codes, event_ids, ssids
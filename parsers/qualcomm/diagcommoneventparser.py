@@ -39,7 +39,7 @@ class DiagCommonEventParser:
         diag_uuid_real = uuid.UUID(bytes_le=b'\x00'*16)
 
         if len(diag_uuid) == 16:
-            diag_uuid_real = uuid.UUID(bytes_le=diag_uuid)
+            diag_uuid_real = uuid.UUID(bytes_le=bytes(diag_uuid))
 
         log_content = "DIAG_QSHRINK_ID: diag_id={}, diag_uuid={}".format(diag_id, diag_uuid_real).encode('utf-8')
 
@@ -57,7 +57,7 @@ class DiagCommonEventParser:
             payload_type = util.gsmtap_type.OSMOCORE_LOG)
 
         diag_id = arg_bin[0]
-        diag_process_name = arg_bin[1:].decode('utf-8')
+        diag_process_name = bytes(arg_bin[1:]).decode('utf-8')
 
         log_content = "DIAG_PROCESS_NAME: diag_id={}, diag_process_name={}".format(diag_id, diag_process_name).encode('utf-8')
 
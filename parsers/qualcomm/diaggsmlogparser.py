@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 from . import diagcmd
+from . import diagstructs
 import util
 
 import struct
@@ -17,27 +18,27 @@ class DiagGsmLogParser:
 
         self.process = {
             # GSM
-            0x5065: lambda x, y, z: self.parse_gsm_fcch(x, y, z), # GSM L1 FCCH Acquisition
-            0x5066: lambda x, y, z: self.parse_gsm_sch(x, y, z), # GSM L1 SCH Acquisition
-            0x506C: lambda x, y, z: self.parse_gsm_l1_burst_metric(x, y, z), # GSM L1 Burst Metrics
-            0x506A: lambda x, y, z: self.parse_gsm_l1_new_burst_metric(x, y, z), # GSM L1 New Burst Metrics
-            0x5071: lambda x, y, z: self.parse_gsm_l1_surround_cell_ba(x, y, z), # GSM Surround Cell BA List
-            0x507A: lambda x, y, z: self.parse_gsm_l1_serv_aux_meas(x, y, z), # GSM L1 Serving Auxiliary Measurments
-            0x507B: lambda x, y, z: self.parse_gsm_l1_neig_aux_meas(x, y, z), # GSM L1 Neighbor Cell Auxiliary Measurments
-            0x5134: lambda x, y, z: self.parse_gsm_cell_info(x, y, z), # GSM RR Cell Information
-            0x512F: lambda x, y, z: self.parse_gsm_rr(x, y, z), # GSM RR Signaling Message
-            #0x5226: lambda x, y, z: parse_gprs_mac(x, y, z), # GPRS MAC Signaling Message
-            0x5230: lambda x, y, z: self.parse_gprs_ota(x, y, z), # GPRS SM/GMM OTA Signaling Message
+            0x5065: self.parse_gsm_fcch, # GSM L1 FCCH Acquisition
+            0x5066: self.parse_gsm_sch, # GSM L1 SCH Acquisition
+            0x506C: self.parse_gsm_l1_burst_metric, # GSM L1 Burst Metrics
+            0x506A: self.parse_gsm_l1_new_burst_metric, # GSM L1 New Burst Metrics
+            0x5071: self.parse_gsm_l1_surround_cell_ba, # GSM Surround Cell BA List
+            0x507A: self.parse_gsm_l1_serv_aux_meas, # GSM L1 Serving Auxiliary Measurments
+            0x507B: self.parse_gsm_l1_neig_aux_meas, # GSM L1 Neighbor Cell Auxiliary Measurments
+            0x5134: self.parse_gsm_cell_info, # GSM RR Cell Information
+            0x512F: self.parse_gsm_rr, # GSM RR Signaling Message
+            #0x5226: parse_gprs_mac, # GPRS MAC Signaling Message
+            0x5230: self.parse_gprs_ota, # GPRS SM/GMM OTA Signaling Message
 
             # GSM DSDS
-            0x5A65: lambda x, y, z: self.parse_gsm_dsds_fcch(x, y, z), # GSM DSDS L1 FCCH Acquisition
-            0x5A66: lambda x, y, z: self.parse_gsm_dsds_sch(x, y, z), # GSM DSDS L1 SCH Acquisition
-            0x5A6C: lambda x, y, z: self.parse_gsm_dsds_l1_burst_metric(x, y, z), # GSM DSDS L1 Burst Metrics
-            0x5A71: lambda x, y, z: self.parse_gsm_dsds_l1_surround_cell_ba(x, y, z), # GSM DSDS Surround Cell BA List
-            0x5A7A: lambda x, y, z: self.parse_gsm_dsds_l1_serv_aux_meas(x, y, z), # GSM DSDS L1 Serving Auxiliary Measurments
-            0x5A7B: lambda x, y, z: self.parse_gsm_dsds_l1_neig_aux_meas(x, y, z), # GSM DSDS L1 Neighbor Cell Auxiliary Measurments
-            0x5B34: lambda x, y, z: self.parse_gsm_dsds_cell_info(x, y, z), # GSM DSDS RR Cell Information
-            0x5B2F: lambda x, y, z: self.parse_gsm_dsds_rr(x, y, z), # GSM DSDS RR Signaling Message
+            0x5A65: self.parse_gsm_dsds_fcch, # GSM DSDS L1 FCCH Acquisition
+            0x5A66: self.parse_gsm_dsds_sch, # GSM DSDS L1 SCH Acquisition
+            0x5A6C: self.parse_gsm_dsds_l1_burst_metric, # GSM DSDS L1 Burst Metrics
+            0x5A71: self.parse_gsm_dsds_l1_surround_cell_ba, # GSM DSDS Surround Cell BA List
+            0x5A7A: self.parse_gsm_dsds_l1_serv_aux_meas, # GSM DSDS L1 Serving Auxiliary Measurments
+            0x5A7B: self.parse_gsm_dsds_l1_neig_aux_meas, # GSM DSDS L1 Neighbor Cell Auxiliary Measurments
+            0x5B34: self.parse_gsm_dsds_cell_info, # GSM DSDS RR Cell Information
+            0x5B2F: self.parse_gsm_dsds_rr, # GSM DSDS RR Signaling Message
         }
 
     # GSM
@@ -66,10 +67,9 @@ class DiagGsmLogParser:
             chan = pkt[1]
             i = 0
             while (2 + 37 * i) < len(pkt):
-                cell_pkt = pkt[2 + 37 * i:2 + 37 * (i + 1)]
-                if len(cell_pkt) < 37:
+                if (2 + 37 * (i + 1)) > len(pkt):
                     break
-                interim = struct.unpack('<LHLhhhhhhbbLBBHLB', cell_pkt)
+                interim = diagstructs.GSM_L1_NEW_BURST_METRIC_V4_CELL.unpack_from(pkt, 2 + 37 * i)
                 c_fn = interim[0]
                 c_arfcn = interim[1] & 0xfff
                 c_band = (interim[1] >> 12)
@@ -101,10 +101,9 @@ class DiagGsmLogParser:
         # for each 23 bytes
         i = 0
         while (1 + 23 * i) < len(pkt):
-            cell_pkt = pkt[1 + 23 * i:1 + 23 * (i + 1)]
-            if len(cell_pkt) < 23:
+            if (1 + 23 * (i + 1)) > len(pkt):
                 break
-            interim = struct.unpack('<LHLhhhhhhb', cell_pkt)
+            interim = diagstructs.GSM_L1_BURST_METRIC_CELL.unpack_from(pkt, 1 + 23 * i)
             c_fn = interim[0]
             c_arfcn = interim[1] & 0xfff
             c_band = (interim[1] >> 12)
@@ -130,8 +129,7 @@ class DiagGsmLogParser:
         num_cells = pkt[0]
         print('Radio {}: 2G Cell: # cells {}'.format(self.parent.sanitize_radio_id(radio_id), num_cells))
         for i in range(num_cells):
-            cell_pkt = pkt[1 + 12 * i:1 + 12 * (i + 1)]
-            interim = struct.unpack('<HhHLH', cell_pkt)
+            interim = diagstructs.GSM_L1_SURROUND_CELL_BA_CELL.unpack_from(pkt, 1 + 12 * i)
             s_arfcn = interim[0] & 0xfff
             s_band = (interim[0] >> 12)
             s_rxpwr = interim[1]
@@ -147,7 +145,7 @@ class DiagGsmLogParser:
         self.parse_gsm_l1_surround_cell_ba(pkt_ts, pkt[1:], radio_id_pkt)
 
     def parse_gsm_l1_serv_aux_meas(self, pkt_ts, pkt, radio_id):
-        interim = struct.unpack('<hB', pkt[0:3])
+        interim = diagstructs.GSM_L1_SERV_AUX_MEAS.unpack_from(pkt, 0)
         rxpwr = interim[0]
         snr_is_bad = interim[1]
         rxpwr_real = rxpwr * 0.0625
@@ -161,8 +159,7 @@ class DiagGsmLogParser:
         num_cells = pkt[0]
         print('Radio {}: 2G Cell Aux: # cells {}'.format(self.parent.sanitize_radio_id(radio_id), num_cells))
         for i in range(num_cells):
-            cell_pkt = pkt[1 + 4 * i:1 + 4 * (i + 1)]
-            interim = struct.unpack('<Hh', cell_pkt)
+            interim = diagstructs.GSM_L1_NEIG_AUX_MEAS_CELL.unpack_from(pkt, 1 + 4 * i)
             n_arfcn = interim[0] & 0xfff
             n_band = (interim[0] >> 12)
             n_rxpwr = interim[1]
@@ -208,8 +205,7 @@ class DiagGsmLogParser:
         rr_channel_map = [8, util.gsmtap_channel.BCCH, 0, util.gsmtap_channel.CCCH, 0x88]
         channel_type = rr_channel_map[chan]
 
-        ts_sec = calendar.timegm(pkt_ts.timetuple())
-        ts_usec = pkt_ts.microsecond
+        ts_sec, ts_usec = util.ts_to_sec_usec(pkt_ts)
 
         # Attach L2 pseudo length
         #if chan == 0 or chan == 4:
@@ -282,8 +278,7 @@ class DiagGsmLogParser:
         # 3: PACCH, 4: Unknown
         channel_type = chan
 
-        ts_sec = calendar.timegm(pkt_ts.timetuple())
-        ts_usec = pkt_ts.microsecond
+        ts_sec, ts_usec = util.ts_to_sec_usec(pkt_ts)
 
         gsmtap_hdr = util.create_gsmtap_header(
             version = 3,
@@ -306,8 +301,7 @@ class DiagGsmLogParser:
         if (msg_dir) == 0x00:
             arfcn = arfcn | (1 << 14)
 
-        ts_sec = calendar.timegm(pkt_ts.timetuple())
-        ts_usec = pkt_ts.microsecond
+        ts_sec, ts_usec = util.ts_to_sec_usec(pkt_ts)
 
         gsmtap_hdr = util.create_gsmtap_header(
             version = 3,
@@ -52,7 +52,7 @@ class DiagLteEventParser:
             version = 2,
             payload_type = util.gsmtap_type.OSMOCORE_LOG)
 
-        log_content = "LTE_RRC_TIMER_STATUS: {}".format(' '.join('{:02x}'.format(x) for x in arg_bin)).encode('utf-8')
+        log_content = "LTE_RRC_TIMER_STATUS: {}".format(arg_bin.hex(' ')).encode('utf-8')
 
         self.parent.writer.write_cp(gsmtap_hdr + osmocore_log_hdr + log_content, radio_id, ts)
 
@@ -193,7 +193,7 @@ class DiagLteEventParser:
             version = 2,
             payload_type = util.gsmtap_type.OSMOCORE_LOG)
 
-        if type(arg1) == bytes:
+        if type(arg1) in (bytes, memoryview):
             log_content = "LTE_RRC_EMM_INCOMING_MSG: {}".format(binascii.hexlify(arg1)).encode('utf-8')
         else:
             log_content = "LTE_RRC_EMM_INCOMING_MSG: {:02x}".format(arg1).encode('utf-8')
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import re
+import struct
+
+# Declarative layouts of versioned log packets
+# A schema maps each version byte (or a tuple of versions sharing a layout)
+# to a struct format and one entry per unpacked item. An entry is either a
+# field name, None for an ignored item, or a tuple of bitfields
+# (name, shift, width) extracted from the item; width None keeps all bits
+# above shift.
+#
+# The schema also lists the fields its handler reads. Every version is
+# compiled once at import time into a decoder returning a plain tuple of
+# exactly these fields, in this order, None where a version lacks one:
+# handlers unpack it positionally whatever the version. Items no listed
+# field is taken from are read as pad bytes. A layout whose remaining items
+# already are the fields in order decodes with the bare Struct.unpack_from,
+# others through a generated function applying the masks and shifts.
+# iter_unpack() decodes a run of back-to-back records, e.g. a cell list,
+# into a list of such tuples without a call per record.
+
+def split_format(fmt):
+    # Format codes, one per unpacked item; pad bytes as their own codes
+    codes = []
+    for count, code in re.findall(r'(\d*)([a-zA-Z?])', fmt[1:]):
+        if code in 'xsp':
+            codes.append(count + code)
+        else:
+            codes.extend([code] * int(count or 1))
+    return codes
+
+class LogDecoder:
+    def __init__(self, version, fmt, entries, fields):
+        self.version = version
+        self.struct = struct.Struct(fmt)
+        self.size = self.struct.size
+
+        if len(entries) != len(self.struct.unpack(bytes(self.size))):
+            raise ValueError('Version {}: {} entries for format {}'.format(version, len(entries), fmt))
+        self.names = set()
+
+        items = []
+        values = {}
+        read_fmt = fmt[0]
+        entries = iter(entries)
+        for code in split_format(fmt):
+            if code.endswith('x'):
+                read_fmt += code
+                continue
+            entry = next(entries)
+            if entry is None:
+                entry = ()
+            elif isinstance(entry, str):
+                entry = ((entry, 0, None),)
+            entry = [x for x in entry if x[0] in fields]
+            self.names.update(x[0] for x in entry)
+            if len(entry) == 0:
+                read_fmt += '{}x'.format(struct.calcsize(fmt[0] + code))
+                continue
+
+            item = 'v{}'.format(len(items))
+            read_fmt += code
+            items.append(item)
+            for name, shift, width in entry:
+                expr = '({} >> {})'.format(item, shift) if shift > 0 else item
+                if width is not None:
+                    expr = '({} & 0x{:x})'.format(expr, (1 << width) - 1)
+                values[name] = expr
+
+        read_struct = struct.Struct(read_fmt)
+        exprs = [values.get(x, 'None') for x in fields]
+        if exprs == items:
+            self.unpack_from = read_struct.unpack_from
+            self.iter_unpack = read_struct.iter_unpack
+            return
+
+        src = 'def unpack_from(buf, offset = 0):\n'
+        src += '    {}, = _unpack_from(buf, offset)\n'.format(', '.join(items))
+        src += '    return ({},)\n'.format(', '.join(exprs))
+        src += 'def iter_unpack(buf):\n'
+        src += '    return [({},) for {}, in _iter_unpack(buf)]\n'.format(', '.join(exprs), ', '.join(items))
+        namespace = {'_unpack_from': read_struct.unpack_from, '_iter_unpack': read_struct.iter_unpack}
+        exec(src, namespace)
+        self.unpack_from = namespace['unpack_from']
+        self.iter_unpack = namespace['iter_unpack']
+
+class LogSchema:
+    def __init__(self, name, fields, layouts):
+        self.name = name
+        self.fields = tuple(fields)
+
+        # Flat lookup table indexed by version byte, None for unknown versions
+        self.decoders = [None] * 0x100
+        names = set()
+        for versions, (fmt, entries) in layouts.items():
+            if not isinstance(versions, tuple):
+                versions = (versions,)
+            decoder = LogDecoder(versions, fmt, entries, self.fields)
+            names |= decoder.names
+            for version in versions:
+                self.decoders[version] = decoder
+
+        unknown = set(self.fields) - names
+        if unknown:
+            raise ValueError('{}: fields {} in no layout'.format(name, ', '.join(sorted(unknown))))
+
+    def get(self, version):
+        return self.decoders[version]
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+import struct
+
+from .diagschema import LogSchema
+
+# Precompiled structures of DIAG commands and log packets
+# Formats are parsed once at import time and shared by all parsers,
+# use unpack_from() with an offset on the packet buffer.
+
+# Generic little endian fields
+U16 = struct.Struct('<H')
+U32 = struct.Struct('<L')
+U64 = struct.Struct('<Q')
+
+# DIAG commands
+DIAG_LOG_HEADER = struct.Struct('<HHQ') # len, log ID, TS (at offset 4)
+DIAG_EXT_MSG_HEADER = struct.Struct('<BBBBQHHL') # cmd_code, ts_type, num_args, drop_cnt, TS, line number, subsystem ID, ?
+DIAG_MULTI_RADIO_HEADER = struct.Struct('<BBHL') # cmd_id, unknown, dummy, subscription_id
+DIAG_EVENT_REPORT_HEADER = struct.Struct('<BH') # cmd_code, len_msg
+
+# 1x
+# 0x11EB: instance, protocol, ifname, R/FBit/Direction/LBit, seqn, segn/fin_seg
+LOG_1X_IP_HEADER = struct.Struct('<BBBBHH')
+
+# GSM
+GSM_L1_NEW_BURST_METRIC_V4_CELL = struct.Struct('<LHLhhhhhhbbLBBHLB') # 0x506A
+GSM_L1_BURST_METRIC_CELL = struct.Struct('<LHLhhhhhhb') # 0x506C
+GSM_L1_SURROUND_CELL_BA_CELL = struct.Struct('<HhHLH') # 0x5071
+GSM_L1_SERV_AUX_MEAS = struct.Struct('<hB') # 0x507A
+GSM_L1_NEIG_AUX_MEAS_CELL = struct.Struct('<Hh') # 0x507B
+
+# UMTS
+UMTS_UE_OTA_HEADER = struct.Struct('<BL') # 0x713A: direction, length
+
+# WCDMA
+# 0x4005: 3G cell and 2G cell for each version
+WCDMA_SEARCH_CELL_RESELECTION_V0_3G = struct.Struct('<HHbhbh')
+WCDMA_SEARCH_CELL_RESELECTION_V0_2G = struct.Struct('<HHbhb')
+WCDMA_SEARCH_CELL_RESELECTION_V1_3G = struct.Struct('<HHbhbhb')
+WCDMA_SEARCH_CELL_RESELECTION_V1_2G = struct.Struct('<HHbhb')
+WCDMA_SEARCH_CELL_RESELECTION_V2_3G = struct.Struct('<HHbhbhbhhb')
+WCDMA_SEARCH_CELL_RESELECTION_V2_2G = struct.Struct('<HHbhbhhb')
+WCDMA_CELL_ID = struct.Struct('<LLLHHHBBBBBBLL') # 0x4127
+WCDMA_RRC_HEADER = struct.Struct('<BBH') # 0x412F: channel type, RBID, length
+WCDMA_RRC_NEW_CHANNEL_HEADER = struct.Struct('<HH') # UARFCN, PSC (at offset 4)
+
+# LTE ML1
+# 0xB17F: Version, RRC standard release, EARFCN, PCI - Serving Layer Priority,
+# Measured, Average RSRP, Measured, Average RSRQ, Measured RSSI,
+# Q_rxlevmin, P_max, Max UE TX Power, S_rxlev, Num DRX S Fail,
+# S Intra Search, S Non Intra Search, Meas Rules Updated, Meas Rules,
+# R9 Info (Rel. 9 only) - Q Qual Min, S Qual, S Intra Search Q, S Non Intra Search Q
+_LTE_ML1_SCELL_MEAS_FIELDS = ('version', 'rrc_rel', 'earfcn',
+    (('pci', 0, 9), ('serv_layer_priority', 9, 7)),
+    (('meas_rsrp', 0, 12),), (('avg_rsrp', 0, 12),),
+    (('meas_rsrq', 0, 10), ('avg_rsrq', 20, 10)),
+    (('meas_rssi', 10, None),), # TODO: get to know exact bit mask
+    (('q_rxlevmin', 0, 6), ('p_max', 6, 7), ('max_ue_tx_pwr', 13, 6), ('s_rxlev', 19, 7), ('num_drx_s_fail', 26, None)),
+    (('s_intra_search', 0, 6), ('s_non_intra_search', 6, 6)))
+LTE_ML1_SCELL_MEAS = LogSchema('LteMl1ScellMeas',
+    ('rrc_rel', 'earfcn', 'pci', 'meas_rsrp', 'meas_rsrq', 'meas_rssi'), {
+    4: ('<BBxxHHLLLLLL', _LTE_ML1_SCELL_MEAS_FIELDS),
+    5: ('<BBxxLHxxLLLLLL', _LTE_ML1_SCELL_MEAS_FIELDS),
+})
+# R9 info follows only on RRC Rel. 9
+LTE_ML1_SCELL_MEAS_R9 = LogSchema('LteMl1ScellMeasR9',
+    ('q_qual_min', 's_qual', 's_intra_search_q', 's_nonintra_search_q'), {
+    (4, 5): ('<L', ((('q_qual_min', 0, 7), ('s_qual', 7, 7), ('s_intra_search_q', 14, 6), ('s_nonintra_search_q', 20, 6)),)),
+})
+# 0xB180: Version, RRC standard release, EARFCN, Q_rxlevmin - Num Cells
+# Cells follow the header back to back
+LTE_ML1_NCELL_MEAS = LogSchema('LteMl1NcellMeas',
+    ('rrc_rel', 'earfcn', 'n_cells'), {
+    4: ('<BBxxHH', ('version', 'rrc_rel', 'earfcn', (('q_rxlevmin', 0, 6), ('n_cells', 6, None)))),
+    5: ('<BBxxLHxx', ('version', 'rrc_rel', 'earfcn', (('q_rxlevmin', 0, 6), ('n_cells', 6, None)))),
+})
+# Cell: PCI - Measured RSSI - Measured RSRP, Average RSRP, Measured RSRQ,
+# Average RSRQ - S_rxlev, Freq Offset, Ant0 Frame/Sample Offset,
+# Ant1 Frame/Sample Offset, Rel 9 S_qual
+LTE_ML1_NCELL_MEAS_CELL = LogSchema('LteMl1NcellMeasCell',
+    ('pci', 'meas_rssi', 'meas_rsrp', 'meas_rsrq'), {
+    (4, 5): ('<LLLLHHLLL', (
+        (('pci', 0, 9), ('meas_rssi', 9, 11), ('meas_rsrp', 20, None)),
+        (('avg_rsrp', 12, 12),),
+        (('meas_rsrq', 12, 10),),
+        (('avg_rsrq', 0, 10), ('s_rxlev', 20, 6)),
+        'freq_offset', None,
+        (('ant0_frame_offset', 0, 11), ('ant0_sample_offset', 11, None)),
+        (('ant1_frame_offset', 0, 11), ('ant1_sample_offset', 11, None)),
+        's_qual')),
+})
+# 0xB197: Version, DL BW, SFN, EARFCN, ..., MIB payload (reversed)
+LTE_ML1_CELL_INFO = LogSchema('LteMl1CellInfo',
+    ('bw', 'sfn', 'earfcn', 'mib_0', 'mib_1', 'mib_2'), {
+    1: ('<BBHH19xBBB', ('version', 'bw', 'sfn', 'earfcn', 'mib_2', 'mib_1', 'mib_0')),
+    2: ('<BBHL21xBBB', ('version', 'bw', 'sfn', 'earfcn', 'mib_2', 'mib_1', 'mib_0')),
+})
+
+# LTE PDCP
+LTE_PDCP_DL_SRB_INT_PDU = struct.Struct('<HHHHLLL') # 0xB0A5: cfg, pdu_size, log_size, sfn_subfn, count, MAC-I, XMAC-I
+LTE_PDCP_UL_SRB_INT_PDU = struct.Struct('<HHHHLL') # 0xB0B5: cfg, pdu_size, log_size, sfn_subfn, count, MAC-I
+
+# LTE RRC
+# 0xB0C1: Version, Physical CID, EARFCN, SFN, Tx Ant, BW
+# Version 17 (MIB-NB): Version, Physical CID, EARFCN, SFN, MIB-NB payload, Tx Ant
+LTE_RRC_MIB = LogSchema('LteRrcMib',
+    ('pci', 'earfcn', 'sfn', 'tx_ant', 'bw', 'mib_nb_0', 'mib_nb_1', 'mib_nb_2', 'mib_nb_3'), {
+    1: ('<BHHHBB', ('version', 'pci', 'earfcn', 'sfn', 'tx_ant', 'bw')),
+    2: ('<BHLHBB', ('version', 'pci', 'earfcn', 'sfn', 'tx_ant', 'bw')),
+    17: ('<BHLHBBBBLB', ('version', 'pci', 'earfcn', 'sfn', 'mib_nb_1', 'mib_nb_0', 'mib_nb_3', 'mib_nb_2', None, 'tx_ant')),
+})
+# 0xB0C2: Version, Physical CID, DL EARFCN, UL EARFCN, DL BW, UL BW
+LTE_RRC_CELL_INFO = LogSchema('LteRrcCellInfo',
+    ('pci', 'earfcn_dl', 'earfcn_ul', 'bw_dl', 'bw_ul'), {
+    2: ('<BHHHBB', ('version', 'pci', 'earfcn_dl', 'earfcn_ul', 'bw_dl', 'bw_ul')),
+    3: ('<BHLLBB', ('version', 'pci', 'earfcn_dl', 'earfcn_ul', 'bw_dl', 'bw_ul')),
+})
+# 0xB0C0: Version, RRC Release, (NR RRC Release), RBID, Physical CID, EARFCN, SysFN/SubFN, PDUN, (Len0), Len1
+# The RRC message follows the header
+_LTE_RRC_OTA_SFN = (('sfn', 4, 12), ('subfn', 0, 4))
+LTE_RRC_OTA = LogSchema('LteRrcOta',
+    ('pci', 'earfcn', 'sfn', 'subfn', 'pdu_num'), {
+    0x1a: ('<BHHBHLHBLH', ('version', 'rrc_rel', 'nr_rrc_rel', 'rbid', 'pci', 'earfcn', _LTE_RRC_OTA_SFN, 'pdu_num', 'len0', 'len1')),
+    (0x08, 0x09, 0x0c, 0x0d, 0x0f, 0x10, 0x13, 0x14, 0x16): ('<BHBHLHBLH', ('version', 'rrc_rel', 'rbid', 'pci', 'earfcn', _LTE_RRC_OTA_SFN, 'pdu_num', 'len0', 'len1')),
+    (0x06, 0x07): ('<BHBHHHBLH', ('version', 'rrc_rel', 'rbid', 'pci', 'earfcn', _LTE_RRC_OTA_SFN, 'pdu_num', 'len0', 'len1')),
+    (0x02, 0x03, 0x04): ('<BHBHHHBH', ('version', 'rrc_rel', 'rbid', 'pci', 'earfcn', _LTE_RRC_OTA_SFN, 'pdu_num', 'len1')),
+})
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 from . import diagcmd
+from . import diagstructs
 import util
 
 import struct
@@ -13,22 +14,19 @@ class DiagUmtsLogParser:
         
         self.process = {
             # UMTS (3G NAS)
-            0x713A: lambda x, y, z: self.parse_umts_ue_ota(x, y, z), # UMTS UE OTA
-            0x7B3A: lambda x, y, z: self.parse_umts_ue_ota_dsds(x, y, z), # UMTS DSDS NAS Signaling Messages
+            0x713A: self.parse_umts_ue_ota, # UMTS UE OTA
+            0x7B3A: self.parse_umts_ue_ota_dsds, # UMTS DSDS NAS Signaling Messages
         }
 
     def parse_umts_ue_ota(self, pkt_ts, pkt, radio_id):
-        msg_hdr = pkt[0:5]
+        msg_hdr = diagstructs.UMTS_UE_OTA_HEADER.unpack_from(pkt, 0) # 1b direction, 4b length
         msg_content = pkt[5:]
-
-        msg_hdr = struct.unpack('<BL', msg_hdr) # 1b direction, 4b length
         arfcn = self.parent.umts_last_uarfcn_dl[self.parent.sanitize_radio_id(radio_id)]
         if msg_hdr[0] == 1:
             # Uplink
             arfcn = self.parent.umts_last_uarfcn_ul[self.parent.sanitize_radio_id(radio_id)]
 
-        ts_sec = calendar.timegm(pkt_ts.timetuple())
-        ts_usec = pkt_ts.microsecond
+        ts_sec, ts_usec = util.ts_to_sec_usec(pkt_ts)
 
         # msg_hdr[1] == L3 message length
         # Rest of content: L3 message
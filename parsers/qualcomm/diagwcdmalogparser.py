@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 from . import diagcmd
+from . import diagstructs
 import util
 
 import struct
@@ -13,9 +14,9 @@ class DiagWcdmaLogParser:
         self.parent = parent
         self.process = {
             # WCDMA (3G RRC)
-            0x4005: lambda x, y, z: self.parse_wcdma_search_cell_reselection(x, y, z), # WCDMA Search Cell Reselection Rank
-            0x4127: lambda x, y, z: self.parse_wcdma_cell_id(x, y, z), # WCDMA Cell ID
-            0x412F: lambda x, y, z: self.parse_wcdma_rrc(x, y, z), # WCDMA Signaling Messages
+            0x4005: self.parse_wcdma_search_cell_reselection, # WCDMA Search Cell Reselection Rank
+            0x4127: self.parse_wcdma_cell_id, # WCDMA Cell ID
+            0x412F: self.parse_wcdma_rrc, # WCDMA Signaling Messages
         }
 
         self.WcdmaSearchCellReselectionV03G = namedtuple('WcdmaSearchCellReselectionV03G',
@@ -44,11 +45,10 @@ class DiagWcdmaLogParser:
         num_gsm_cells = pkt[1] & 0x3f # lower 6b
 
         print('Radio {}: {} 3G cells, {} 2G cells'.format(self.parent.sanitize_radio_id(radio_id), num_wcdma_cells, num_gsm_cells))
-        cell_pkt_struct_3g = '<HHbhbh'
-        cell_pkt_size_3g = struct.calcsize(cell_pkt_struct_3g)
+        cell_pkt_struct_3g = diagstructs.WCDMA_SEARCH_CELL_RESELECTION_V0_3G
+        cell_pkt_size_3g = cell_pkt_struct_3g.size
         for i in range(num_wcdma_cells):
-            cell_pkt = pkt[2 + cell_pkt_size_3g * i: 2 + cell_pkt_size_3g * (i + 1)]
-            cell_pkt_vals = self.WcdmaSearchCellReselectionV03G._make(struct.unpack(cell_pkt_struct_3g, cell_pkt))
+            cell_pkt_vals = self.WcdmaSearchCellReselectionV03G._make(cell_pkt_struct_3g.unpack_from(pkt, 2 + cell_pkt_size_3g * i))
             print('Radio {}: 3G Cell {}: UARFCN {}, PSC {:3d}, RSCP {}, Ec/Io {:.2f}'
                 .format(self.parent.sanitize_radio_id(radio_id), i, 
                     cell_pkt_vals.uarfcn, cell_pkt_vals.psc, 
@@ -56,11 +56,10 @@ class DiagWcdmaLogParser:
 
         if num_gsm_cells > 0:
             gsm_cell_start_pos = 2 + cell_pkt_size_3g * num_wcdma_cells
-            cell_pkt_struct_2g = '<HHbhb'
-            cell_pkt_size_2g = struct.calcsize(cell_pkt_struct_2g)
+            cell_pkt_struct_2g = diagstructs.WCDMA_SEARCH_CELL_RESELECTION_V0_2G
+            cell_pkt_size_2g = cell_pkt_struct_2g.size
             for i in range(num_gsm_cells):
-                cell_pkt = pkt[gsm_cell_start_pos + cell_pkt_size_2g * i: gsm_cell_start_pos + cell_pkt_size_2g * (i + 1)]
-                cell_pkt_vals = self.WcdmaSearchCellReselectionV02G._make(struct.unpack(cell_pkt_struct_2g, cell_pkt))
+                cell_pkt_vals = self.WcdmaSearchCellReselectionV02G._make(cell_pkt_struct_2g.unpack_from(pkt, gsm_cell_start_pos + cell_pkt_size_2g * i))
                 print('Radio {}: 2G Cell {}: ARFCN {}, RSSI {:.2f}, Rank {}'
                     .format(self.parent.sanitize_radio_id(radio_id), i, 
                         cell_pkt_vals.arfcn & 0xfff,
@@ -72,11 +71,10 @@ class DiagWcdmaLogParser:
         num_gsm_cells = pkt[1] & 0x3f # lower 6b
 
         print('Radio {}: {} 3G cells, {} 2G cells'.format(self.parent.sanitize_radio_id(radio_id), num_wcdma_cells, num_gsm_cells))
-        cell_pkt_struct_3g = '<HHbhbhb'
-        cell_pkt_size_3g = struct.calcsize(cell_pkt_struct_3g)
+        cell_pkt_struct_3g = diagstructs.WCDMA_SEARCH_CELL_RESELECTION_V1_3G
+        cell_pkt_size_3g = cell_pkt_struct_3g.size
         for i in range(num_wcdma_cells):
-            cell_pkt = pkt[2 + cell_pkt_size_3g * i: 2 + cell_pkt_size_3g * (i + 1)]
-            cell_pkt_vals = self.WcdmaSearchCellReselectionV13G._make(struct.unpack(cell_pkt_struct_3g, cell_pkt))
+            cell_pkt_vals = self.WcdmaSearchCellReselectionV13G._make(cell_pkt_struct_3g.unpack_from(pkt, 2 + cell_pkt_size_3g * i))
             print('Radio {}: 3G Cell {}: UARFCN {}, PSC {:3d}, RSCP {}, Ec/Io {:.2f}'
                 .format(self.parent.sanitize_radio_id(radio_id), i, 
                     cell_pkt_vals.uarfcn, cell_pkt_vals.psc, 
@@ -84,11 +82,10 @@ class DiagWcdmaLogParser:
 
         if num_gsm_cells > 0:
             gsm_cell_start_pos = 2 + cell_pkt_size_3g * num_wcdma_cells
-            cell_pkt_struct_2g = '<HHbhb'
-            cell_pkt_size_2g = struct.calcsize(cell_pkt_struct_2g)
+            cell_pkt_struct_2g = diagstructs.WCDMA_SEARCH_CELL_RESELECTION_V1_2G
+            cell_pkt_size_2g = cell_pkt_struct_2g.size
             for i in range(num_gsm_cells):
-                cell_pkt = pkt[gsm_cell_start_pos + cell_pkt_size_2g * i: gsm_cell_start_pos + cell_pkt_size_2g * (i + 1)]
-                cell_pkt_vals = self.WcdmaSearchCellReselectionV12G._make(struct.unpack(cell_pkt_struct_2g, cell_pkt))
+                cell_pkt_vals = self.WcdmaSearchCellReselectionV12G._make(cell_pkt_struct_2g.unpack_from(pkt, gsm_cell_start_pos + cell_pkt_size_2g * i))
                 print('Radio {}: 2G Cell {}: ARFCN {}, RSSI {:.2f}, Rank {}'
                     .format(self.parent.sanitize_radio_id(radio_id), i, 
                         cell_pkt_vals.arfcn & 0xfff,
@@ -100,11 +97,10 @@ class DiagWcdmaLogParser:
         num_gsm_cells = pkt[1] & 0x3f # lower 6b
 
         print('Radio {}: {} 3G cells, {} 2G cells'.format(self.parent.sanitize_radio_id(radio_id), num_wcdma_cells, num_gsm_cells))
-        cell_pkt_struct_3g = '<HHbhbhbhhb'
-        cell_pkt_size_3g = struct.calcsize(cell_pkt_struct_3g)
+        cell_pkt_struct_3g = diagstructs.WCDMA_SEARCH_CELL_RESELECTION_V2_3G
+        cell_pkt_size_3g = cell_pkt_struct_3g.size
         for i in range(num_wcdma_cells):
-            cell_pkt = pkt[7 + cell_pkt_size_3g * i: 7 + cell_pkt_size_3g * (i + 1)]
-            cell_pkt_vals = self.WcdmaSearchCellReselectionV23G._make(struct.unpack(cell_pkt_struct_3g, cell_pkt))
+            cell_pkt_vals = self.WcdmaSearchCellReselectionV23G._make(cell_pkt_struct_3g.unpack_from(pkt, 7 + cell_pkt_size_3g * i))
             print('Radio {}: 3G Cell {}: UARFCN {}, PSC {:3d}, RSCP {}, Ec/Io {:.2f}'
                 .format(self.parent.sanitize_radio_id(radio_id), i, 
                     cell_pkt_vals.uarfcn, cell_pkt_vals.psc, 
@@ -112,11 +108,10 @@ class DiagWcdmaLogParser:
 
         if num_gsm_cells > 0:
             gsm_cell_start_pos = 7 + cell_pkt_size_3g * num_wcdma_cells
-            cell_pkt_struct_2g = '<HHbhbhhb'
-            cell_pkt_size_2g = struct.calcsize(cell_pkt_struct_2g)
+            cell_pkt_struct_2g = diagstructs.WCDMA_SEARCH_CELL_RESELECTION_V2_2G
+            cell_pkt_size_2g = cell_pkt_struct_2g.size
             for i in range(num_gsm_cells):
-                cell_pkt = pkt[gsm_cell_start_pos + cell_pkt_size_2g * i: gsm_cell_start_pos + cell_pkt_size_2g * (i + 1)]
-                cell_pkt_vals = self.WcdmaSearchCellReselectionV22G._make(struct.unpack(cell_pkt_struct_2g, cell_pkt))
+                cell_pkt_vals = self.WcdmaSearchCellReselectionV22G._make(cell_pkt_struct_2g.unpack_from(pkt, gsm_cell_start_pos + cell_pkt_size_2g * i))
                 print('Radio {}: 2G Cell {}: ARFCN {}, RSSI {:.2f}, Rank {}'
                     .format(self.parent.sanitize_radio_id(radio_id), i, 
                         cell_pkt_vals.arfcn & 0xfff,
@@ -134,10 +129,10 @@ class DiagWcdmaLogParser:
             self.parse_wcdma_search_cell_reselection_v2(pkt_ts, pkt, radio_id)
         else:
             self.parent.logger.log(logging.WARNING, 'Unsupported WCDMA search cell reselection version {}'.format(pkt_version))
-            self.parent.logger.log(logging.DEBUG, util.xxd(pkt))
+            self.parent.logger.log(logging.DEBUG, util.LazyHexdump(pkt))
 
     def parse_wcdma_cell_id(self, pkt_ts, pkt, radio_id):
-        result = struct.unpack('<LLLHHHBBBBBBLL', pkt[0:32])
+        result = diagstructs.WCDMA_CELL_ID.unpack_from(pkt, 0)
         # UARFCN UL, UARFCN DL, CID, URA_ID, FLAGS, PSC, PLMN_ID, LAC, RAC
         # PSC needs to be >>4'ed
         self.parent.umts_last_uarfcn_ul[self.parent.sanitize_radio_id(radio_id)] = result[0] | (1 << 14)
@@ -145,7 +140,7 @@ class DiagWcdmaLogParser:
         self.parent.umts_last_cell_id[self.parent.sanitize_radio_id(radio_id)] = result[2] & 0x7fff
 
     def parse_wcdma_rrc(self, pkt_ts, pkt, radio_id):
-        channel_type, rbid, msg_len = struct.unpack('<BBH', pkt[0:4])
+        channel_type, rbid, msg_len = diagstructs.WCDMA_RRC_HEADER.unpack_from(pkt, 0)
         sib_class = -1
         arfcn = 0
         msg_content = b''
@@ -279,13 +274,13 @@ class DiagWcdmaLogParser:
                 return
         elif channel_type in channel_type_map_new.keys():
             # uint16 uarfcn, uint16 psc, uint8 msg[]
-            arfcn, psc = struct.unpack('<HH', pkt[4:8])
+            arfcn, psc = diagstructs.WCDMA_RRC_NEW_CHANNEL_HEADER.unpack_from(pkt, 4)
 
             subtype = channel_type_map_new[channel_type]
             msg_content = pkt[8:]
         elif channel_type in channel_type_map_new_extended_type.keys():
             # uint16 uarfcn, uint16 psc, uint8 subtype, uint8 msg[]
-            arfcn, psc = struct.unpack('<HH', pkt[4:8])
+            arfcn, psc = diagstructs.WCDMA_RRC_NEW_CHANNEL_HEADER.unpack_from(pkt, 4)
 
             if pkt[8] in sib_type_map_new.keys():
                 subtype = sib_type_map_new[pkt[8]]
@@ -295,11 +290,10 @@ class DiagWcdmaLogParser:
                 return
         else:
             self.parent.logger.log(logging.WARNING, "Unknown WCDMA RRC channel type {}".format(pkt[0]))
-            self.parent.logger.log(logging.DEBUG, util.xxd(pkt))
+            self.parent.logger.log(logging.DEBUG, util.LazyHexdump(pkt))
             return
 
-        ts_sec = calendar.timegm(pkt_ts.timetuple())
-        ts_usec = pkt_ts.microsecond
+        ts_sec, ts_usec = util.ts_to_sec_usec(pkt_ts)
 
         gsmtap_hdr = util.create_gsmtap_header(
             version = 3,
@@ -6,6 +6,7 @@
 # (C) 2013-2016 by Harald Welte <laforge@gnumonks.org>
 
 from . import diagcmd
+from . import diagstructs
 from .diaggsmlogparser import DiagGsmLogParser
 from .diagwcdmalogparser import DiagWcdmaLogParser
 from .diagumtslogparser import DiagUmtsLogParser
@@ -19,6 +20,7 @@ import util
 import usb
 import struct
 import calendar, datetime
+import time
 import logging
 
 class QualcommParser:
@@ -41,17 +43,32 @@ class QualcommParser:
         self.lte_last_band_ind = [0, 0]
         self.lte_last_tcrnti = [1, 1]
 
+        # Last full 64-bit QXDM timestamp, reference for truncated event timestamps
+        self.qxdm_last_ts = [0, 0]
+
         self.io_device = None
         self.writer = None
+        self.stats = None
+        self.loss = None
+        self.idle = util.IdleBackoff()
         self.parse_msgs = False
         self.parse_events = False
         self.qsr_hash_filename = ''
         self.qsr4_hash_filename = ''
+        self.crc_sample_interval = 1
+        self.crc_phase = 0
+        self.crc_mismatches = 0
+        # Log codes, event IDs and message SSIDs given by --log-codes,
+        # None for the built-in masks
+        self.log_code_list = None
+        self.event_id_list = None
+        self.ssid_list = None
 
         self.name = 'qualcomm'
         self.shortname = 'qc'
 
         self.logger = logging.getLogger('scat.qualcommparser')
+        self.deframer = util.HdlcDeframer()
 
         self.diag_log_parsers = [DiagGsmLogParser(self),
             DiagWcdmaLogParser(self), DiagUmtsLogParser(self),
@@ -80,12 +97,62 @@ class QualcommParser:
             except AttributeError:
                 pass
 
+        self.rebuild_dispatch_tables()
+
+    def rebuild_dispatch_tables(self):
+        # Flat lookup tables indexed by 16-bit log code and 12-bit event ID,
+        # to be called again whenever process or process_event are changed.
+        # None marks unhandled or ignored log codes and unhandled event IDs.
+        self.log_dispatch = [None] * 0x10000
+        for log_code, handler in self.process.items():
+            self.log_dispatch[log_code] = handler
+
+        if self.event_id_list is not None:
+            # Events outside of --log-codes are dropped silently
+            self.event_dispatch = [self.ignore_event] * 0x1000
+            for event_id in self.event_id_list:
+                self.event_dispatch[event_id & 0xfff] = None
+        else:
+            self.event_dispatch = [None] * 0x1000
+        for event_id in self.no_process_event.keys():
+            self.event_dispatch[event_id] = self.ignore_event
+        for event_id, handler in self.process_event.items():
+            self.event_dispatch[event_id] = handler
+
     def set_io_device(self, io_device):
         self.io_device = io_device
 
     def set_writer(self, writer):
         self.writer = writer
 
+    def set_stats(self, stats):
+        self.stats = stats
+
+    def set_loss_stats(self, loss):
+        self.loss = loss
+
+    def get_memory_usage(self):
+        # Bytes held by buffers that live across packets, per buffer
+        usage = {'deframer buffer': len(self.deframer.buf)}
+        for p in self.diag_log_parsers:
+            try:
+                usage.update(p.get_memory_usage())
+            except AttributeError:
+                pass
+        return usage
+
+    def set_stage_timer(self, timer):
+        # Profiling only: replaces pipeline methods and handlers by timed wrappers
+        timer.instrument(self.deframer, 'feed', 'deframe')
+        for attr in ('parse_diag', 'parse_diag_log', 'parse_diag_event',
+                'parse_diag_ext_msg', 'parse_diag_multisim'):
+            timer.instrument(self, attr, 'dispatch')
+
+        for process in (self.process, self.process_event):
+            for key in process.keys():
+                process[key] = timer.wrap('decode', process[key])
+        self.rebuild_dispatch_tables()
+
     def set_parameter(self, params):
         for p in params:
             if p == 'log_level':
@@ -100,6 +167,34 @@ class QualcommParser:
                 self.parse_events = params[p]
             elif p == 'msgs':
                 self.parse_msgs = params[p]
+            elif p == 'crc-sample':
+                self.crc_sample_interval = params[p]
+            elif p == 'log-codes':
+                if params[p]:
+                    self.load_log_code_list(params[p])
+
+    def load_log_code_list(self, filename):
+        with open(filename, 'r') as f:
+            log_codes, event_ids, ssids = diagcmd.parse_log_code_list(f)
+        self.set_log_code_list(log_codes, event_ids, ssids)
+
+    def set_log_code_list(self, log_codes, event_ids, ssids):
+        # Restricts device masks and host dispatch to the given items
+        self.log_code_list = log_codes
+        self.event_id_list = event_ids
+        self.ssid_list = ssids
+
+        for log_code in sorted(log_codes):
+            if not (log_code in self.process.keys()):
+                self.logger.log(logging.WARNING, 'Log code 0x{:04X} has no decoder, only counted'.format(log_code))
+
+        for key in list(self.process.keys()):
+            if not (key in log_codes):
+                del self.process[key]
+        for key in list(self.process_event.keys()):
+            if not (key in event_ids):
+                del self.process_event[key]
+        self.rebuild_dispatch_tables()
 
     def sanitize_radio_id(self, radio_id):
         if radio_id <= 0:
@@ -151,42 +246,72 @@ class QualcommParser:
 
     def prepare_diag(self):
         self.logger.log(logging.INFO, 'Starting diag')
-        # Static event reporting Enable
-        self.io_device.write_then_read_discard(util.generate_packet(struct.pack('<BB', diagcmd.DIAG_EVENT_REPORT_F, 0x01)), 0x1000, False)
+        if self.event_id_list is None or len(self.event_id_list) > 0:
+            # Static event reporting Enable
+            self.io_device.write_then_read_discard(util.generate_packet(struct.pack('<BB', diagcmd.DIAG_EVENT_REPORT_F, 0x01)), 0x1000, False)
+        else:
+            # Log code list without events: Static event reporting Disable
+            self.io_device.write_then_read_discard(util.generate_packet(struct.pack('<BB', diagcmd.DIAG_EVENT_REPORT_F, 0x00)), 0x1000, False)
+
+        if self.log_code_list is None:
+            self.io_device.write_then_read_discard(util.generate_packet(diagcmd.log_mask_scat_1x()), 0x1000, False)
+            self.io_device.write_then_read_discard(util.generate_packet(diagcmd.log_mask_scat_wcdma()), 0x1000, False)
+            self.io_device.write_then_read_discard(util.generate_packet(diagcmd.log_mask_scat_gsm()), 0x1000, False)
+            self.io_device.write_then_read_discard(util.generate_packet(diagcmd.log_mask_scat_umts()), 0x1000, False)
+            self.io_device.write_then_read_discard(util.generate_packet(diagcmd.log_mask_scat_lte()), 0x1000, False)
+            return
+
+        for equip_id in sorted(set(x >> 12 for x in self.log_code_list)):
+            if not (equip_id in diagcmd.log_mask_last_item.keys()):
+                self.logger.log(logging.WARNING, 'Not enabling log codes of unknown equipment ID {}'.format(equip_id))
+                continue
+            self.io_device.write_then_read_discard(util.generate_packet(diagcmd.log_mask_from_codes(equip_id, self.log_code_list)), 0x1000, False)
+
+        if len(self.event_id_list) > 0:
+            self.io_device.write_then_read_discard(util.generate_packet(diagcmd.create_event_mask_set(max(self.event_id_list), *self.event_id_list)), 0x1000, False)
 
-        self.io_device.write_then_read_discard(util.generate_packet(diagcmd.log_mask_scat_1x()), 0x1000, False)
-        self.io_device.write_then_read_discard(util.generate_packet(diagcmd.log_mask_scat_wcdma()), 0x1000, False)
-        self.io_device.write_then_read_discard(util.generate_packet(diagcmd.log_mask_scat_gsm()), 0x1000, False)
-        self.io_device.write_then_read_discard(util.generate_packet(diagcmd.log_mask_scat_umts()), 0x1000, False)
-        self.io_device.write_then_read_discard(util.generate_packet(diagcmd.log_mask_scat_lte()), 0x1000, False)
+        for ssid in sorted(self.ssid_list):
+            # All message levels of the listed subsystems
+            self.io_device.write_then_read_discard(util.generate_packet(diagcmd.create_extended_message_config_set_mask(ssid, ssid, 0xffffffff)), 0x1000, False)
 
     def parse_diag(self, pkt, hdlc_encoded = True, check_crc = True, radio_id = 0):
         # Should contain DIAG command and CRC16
         # pkt should not contain trailing 0x7E, and either HDLC encoded or not
-        # When the pkt is not HDLC encoded, hdlc_encoded should be set to True
+        # When the pkt is not HDLC encoded, hdlc_encoded should be set to False
         # radio_id = 0 for default, larger than 1 for SIM 1 and such
 
         if len(pkt) < 3:
+            if self.loss is not None:
+                self.loss.count('truncated')
             return
 
         if hdlc_encoded:
-            pkt = util.unwrap(pkt)
+            pkt = util.unwrap(bytes(pkt))
 
         # Check and strip CRC if existing
         if check_crc:
             crc = util.dm_crc16(pkt[:-2])
             crc_pkt = (pkt[-1] << 8) | pkt[-2]
             if crc != crc_pkt:
-                self.logger.log(logging.WARNING, "CRC mismatch: expected 0x{:04x}, got 0x{:04x}".format(crc, crc_pkt))
-                self.logger.log(logging.DEBUG, util.xxd(pkt))
+                self.report_crc_mismatch(pkt)
             pkt = pkt[:-2]
 
         if pkt[0] == diagcmd.DIAG_LOG_F:
             self.parse_diag_log(pkt, radio_id)
         elif pkt[0] == diagcmd.DIAG_EVENT_REPORT_F and self.parse_events:
-            self.parse_diag_event(pkt, radio_id)
-        elif pkt[0] == diagcmd.DIAG_EXT_MSG_F and self.parse_msgs:
-            self.parse_diag_ext_msg(pkt, radio_id)
+            if self.loss is not None:
+                self.parse_counting_exceptions(self.parse_diag_event, pkt, radio_id)
+            else:
+                self.parse_diag_event(pkt, radio_id)
+        elif pkt[0] == diagcmd.DIAG_EXT_MSG_F:
+            if self.loss is not None and len(pkt) >= 16 and pkt[3] > 0:
+                # Messages dropped by the modem since the last one, per SSID
+                self.loss.count('device', diagstructs.U16.unpack_from(pkt, 14)[0], pkt[3])
+            if self.parse_msgs:
+                if self.loss is not None:
+                    self.parse_counting_exceptions(self.parse_diag_ext_msg, pkt, radio_id)
+                else:
+                    self.parse_diag_ext_msg(pkt, radio_id)
         elif pkt[0] == diagcmd.DIAG_QSR_EXT_MSG_TERSE_F and self.parse_msgs:
             #self.parse_diag_qsr_ext_msg(pkt, radio_id)
             pass
@@ -200,35 +325,136 @@ class QualcommParser:
             #util.xxd(pkt)
             return
 
+    def parse_counting_exceptions(self, parse, pkt, radio_id):
+        # Decoder failures are counted and the packet dropped
+        try:
+            parse(pkt, radio_id)
+        except Exception:
+            self.loss.count('exception')
+            self.logger.log(logging.DEBUG, 'Exception in {} of command 0x{:02x}'.format(parse.__name__, pkt[0]), exc_info = True)
+
+    def report_truncated(self, log_code, pkt, expected):
+        # Log packet shorter than its decoder needs, dropped by the handler
+        if self.loss is not None:
+            self.loss.count('truncated', log_code)
+        self.logger.log(logging.WARNING, 'Log 0x{:04X} truncated: expected at least {} bytes, got {}'.format(log_code, expected, len(pkt)))
+        self.logger.log(logging.DEBUG, util.LazyHexdump(pkt))
+
+    def report_crc_mismatch(self, pkt: "Unescaped frame with trailing CRC"):
+        crc = util.dm_crc16(pkt[:-2])
+        crc_pkt = (pkt[-1] << 8) | pkt[-2]
+        self.crc_mismatches += 1
+        if self.loss is not None:
+            log_code = diagstructs.U16.unpack_from(pkt, 6)[0] if pkt[0] == diagcmd.DIAG_LOG_F and len(pkt) >= 10 else None
+            self.loss.count('crc', log_code)
+        self.logger.log(logging.WARNING, "CRC mismatch: expected 0x{:04x}, got 0x{:04x}".format(crc, crc_pkt))
+        self.logger.log(logging.DEBUG, util.LazyHexdump(pkt))
+
     def run_diag(self, writer_qmdl = None):
-        oldbuf = b''
+        self.deframer.reset()
         loop = True
         try:
             while loop:
+                self.idle.begin()
                 buf = self.io_device.read(0x1000)
                 if len(buf) == 0:
                     if self.io_device.block_until_data:
+                        self.idle.wait()
                         continue
                     else:
                         loop = False
-                buf = oldbuf + buf
-                buf_atom = buf.split(b'\x7e')
-
-                if len(buf) < 1 or buf[-1] != 0x7e:
-                    oldbuf = buf_atom.pop()
-                else:
-                    oldbuf = b''
-
-                for pkt in buf_atom:
-                    if len(pkt) == 0:
+                self.idle.reset()
+
+                if writer_qmdl:
+                    writer_qmdl.write_cp(buf)
+
+                if getattr(self.io_device, 'read_gap', False):
+                    # Transfers were dropped before buf, do not splice frames across
+                    self.deframer.discard()
+                frames = self.deframer.feed(buf)
+                crc_valid = util.dm_crc16_check_batch(frames, self.crc_sample_interval, self.crc_phase)
+                self.crc_phase += len(frames)
+                if self.loss is not None:
+                    self.loss.poll(self.writer)
+
+                for pkt, pkt_crc_valid in zip(frames, crc_valid):
+                    if len(pkt) < 3:
+                        if self.loss is not None:
+                            self.loss.count('truncated')
                         continue
-                    self.parse_diag(pkt)
-                    if writer_qmdl:
-                        writer_qmdl.write_cp(pkt + b'\x7e')
+                    if not pkt_crc_valid:
+                        self.report_crc_mismatch(pkt)
+                    self.parse_diag(memoryview(pkt)[:-2], hdlc_encoded = False, check_crc = False)
 
         except KeyboardInterrupt:
             return
 
+    def iter_dump_frames(self):
+        # Offline QMDL path: frames large chunks of the dump at once with
+        # NumPy instead of feeding the streaming deframer. Yields lists of
+        # unescaped frames with trailing CRC.
+        self.deframer.reset()
+        if util.np is None:
+            while True:
+                buf = self.io_device.read(0x100000)
+                if len(buf) == 0:
+                    break
+                yield self.deframer.feed(buf)
+            return
+
+        # Mapped dumps: step back over the partial trailing frame instead of
+        # copying it in front of the next chunk
+        rewind = getattr(self.io_device, 'rewind', None)
+        remainder = b''
+        while True:
+            buf = self.io_device.read(0x1000000)
+            if len(buf) == 0:
+                break
+            full_chunk = (len(buf) == 0x1000000)
+            if len(remainder) > 0:
+                buf = b''.join((remainder, buf))
+
+            frame_data, offsets, lengths, consumed, leading_delim = util.hdlc_scan_frames(buf)
+            if self.deframer.resync and len(offsets) > 0 and not leading_delim:
+                # First frame is the tail of a dropped oversized frame
+                self.deframer.dropped_bytes += int(lengths[0])
+                offsets = offsets[1:]
+                lengths = lengths[1:]
+            if consumed > 0:
+                self.deframer.resync = False
+
+            remainder = buf[consumed:]
+            if len(remainder) > self.deframer.max_frame_size:
+                self.deframer.dropped_bytes += len(remainder)
+                remainder = b''
+                self.deframer.resync = True
+            elif full_chunk and len(remainder) > 0 and rewind is not None and rewind(len(remainder)):
+                remainder = b''
+
+            frames = [frame_data[x:x + y] for x, y in zip(offsets.tolist(), lengths.tolist())]
+            self.deframer.frames += len(frames)
+            yield frames
+
+    def run_diag_bulk(self):
+        if util.np is None:
+            self.run_diag()
+            return
+
+        for frames in self.iter_dump_frames():
+            crc_valid = util.dm_crc16_check_batch(frames, self.crc_sample_interval, self.crc_phase)
+            self.crc_phase += len(frames)
+            if self.loss is not None:
+                self.loss.poll(self.writer)
+
+            for pkt, pkt_crc_valid in zip(frames, crc_valid):
+                if len(pkt) < 3:
+                    if self.loss is not None:
+                        self.loss.count('truncated')
+                    continue
+                if not pkt_crc_valid:
+                    self.report_crc_mismatch(pkt)
+                self.parse_diag(memoryview(pkt)[:-2], hdlc_encoded = False, check_crc = False)
+
     def stop_diag(self):
         self.io_device.read(0x1000)
         self.logger.log(logging.INFO, 'Stopping diag')
@@ -237,75 +463,182 @@ class QualcommParser:
         self.io_device.write_then_read_discard(util.generate_packet(struct.pack('<LL', diagcmd.DIAG_LOG_CONFIG_F, diagcmd.LOG_CONFIG_DISABLE_OP)), 0x1000, False)
         self.io_device.write_then_read_discard(util.generate_packet(b'\x7d\x05\x00\x00\x00\x00\x00\x00'), 0x1000, False)
 
-    def parse_dlf(self):
+    def iter_dlf_packets(self):
+        # DLF holds bare log packets, yielded as DIAG_LOG_F commands without CRC
+        # Packets are sliced by offset; the partial trailing packet is
+        # stepped back over on mapped dumps, carried over otherwise
+        rewind = getattr(self.io_device, 'rewind', None)
         oldbuf = b''
         while True:
             buf = self.io_device.read(0x100000)
             #print("%d"% len(buf))
             if len(buf) == 0:
                 break
-            buf = oldbuf + buf
-
-            pkt_len = struct.unpack('<H', buf[0:2])[0]
-            while len(buf) >= pkt_len:
+            full_chunk = (len(buf) == 0x100000)
+            if len(oldbuf) > 0:
+                buf = b''.join((oldbuf, buf))
+
+            pos = 0
+            end = len(buf)
+            pkt_len = diagstructs.U16.unpack_from(buf, 0)[0]
+            while end - pos >= pkt_len:
                 # DLF lacks CRC16/other fancy stuff
-                pkt = buf[0:pkt_len]
+                pkt = buf[pos:pos + pkt_len]
                 pkt = b'\x10\x00' + pkt[0:2] + pkt
-                calculated_crc = util.dm_crc16(pkt)
-                pkt = pkt + struct.pack('<H', calculated_crc)
 
                 #print("%02x %02x" % (pkt_len, len(buf)))
-                self.parse_diag(pkt, hdlc_encoded = False)
-                buf = buf[pkt_len:]
+                self.deframer.frames += 1
+                yield pkt
+                pos += pkt_len
 
-                if len(buf) < 2:
+                if end - pos < 2:
                     break
-                pkt_len = struct.unpack('<H', buf[0:2])[0]
+                pkt_len = diagstructs.U16.unpack_from(buf, pos)[0]
+
+            oldbuf = buf[pos:]
+            if full_chunk and len(oldbuf) > 0 and rewind is not None and rewind(len(oldbuf)):
+                oldbuf = b''
 
-            oldbuf = buf
+    def parse_dlf(self):
+        for pkt in self.iter_dlf_packets():
+            self.parse_diag(pkt, hdlc_encoded = False, check_crc = False)
+            if self.loss is not None:
+                self.loss.poll(self.writer)
 
     def read_dump(self):
         while self.io_device.file_available:
             self.logger.log(logging.INFO, "Reading from {}".format(self.io_device.fname))
             if self.io_device.fname.find('.qmdl') > 0:
-                self.run_diag()
+                self.run_diag_bulk()
             elif self.io_device.fname.find('.dlf') > 0:
                 self.parse_dlf()
             else:
                 self.logger.log(logging.INFO, 'Unknown baseband dump type, assuming QMDL')
-                self.run_diag()
+                self.run_diag_bulk()
             self.io_device.open_next_file()
 
+    def survey_dump(self, survey):
+        # Header-only pass over the dump files: frames are only split and
+        # classified, no CRC check, decoding or output
+        while self.io_device.file_available:
+            self.logger.log(logging.INFO, "Surveying {}".format(self.io_device.fname))
+            survey.start_file(self.io_device.fname)
+            read_bytes = self.io_device.read_bytes
+            if self.io_device.fname.find('.dlf') > 0:
+                # Not counting the 4 byte command header iter_dlf_packets() adds
+                self.survey_frames(survey, ([x] for x in self.iter_dlf_packets()), 0, 4)
+            else:
+                self.survey_frames(survey, self.iter_dump_frames(), 2)
+            survey.end_file(self.io_device.read_bytes - read_bytes)
+            self.io_device.open_next_file()
+
+    def survey_frames(self, survey, frame_lists, crc_len, header_len = 0):
+        commands = survey.current['commands']
+        logs = survey.current['logs']
+        ts_min = survey.current['ts_min']
+        ts_max = survey.current['ts_max']
+        unpack_log_header = diagstructs.DIAG_LOG_HEADER.unpack_from
+
+        for frames in frame_lists:
+            for pkt in frames:
+                pkt_len = len(pkt) - crc_len
+                if pkt_len < 1:
+                    continue
+                cmd = pkt[0]
+                pos = 0
+                if cmd == diagcmd.DIAG_MULTI_RADIO_CMD_F and pkt_len > 8:
+                    # Account the wrapped command
+                    pos = 8
+                    cmd = pkt[8]
+
+                counter = commands.get(cmd)
+                if counter is None:
+                    counter = commands[cmd] = [0, 0]
+                counter[0] += 1
+                counter[1] += pkt_len - header_len
+
+                if cmd != diagcmd.DIAG_LOG_F or pkt_len - pos < 16:
+                    continue
+                log_len, log_code, ts = unpack_log_header(pkt, pos + 4)
+                key = (log_code, pkt[pos + 16] if pkt_len - pos > 16 else None)
+                counter = logs.get(key)
+                if counter is None:
+                    counter = logs[key] = [0, 0]
+                counter[0] += 1
+                counter[1] += pkt_len - pos - header_len
+
+                if ts_min is None or ts < ts_min:
+                    ts_min = ts
+                if ts_max is None or ts > ts_max:
+                    ts_max = ts
+
+        survey.current['ts_min'] = ts_min
+        survey.current['ts_max'] = ts_max
+
+    def reconstruct_qxdm_ts(self, ts_trunc, radio_id):
+        # Truncated timestamp holds the lower 16 bits of the 1/800s tick count
+        # (bits 16-31 of full timestamp), wrapping every 81.92s.
+        # Extend it from the last full timestamp of the radio in either direction.
+        radio_idx = self.sanitize_radio_id(radio_id)
+        last_ts = self.qxdm_last_ts[radio_idx]
+        if last_ts == 0:
+            # No reference yet
+            return time.time_ns()
+
+        last_tick = last_ts >> 16
+        delta = (ts_trunc - last_tick) & 0xffff
+        if delta >= 0x8000:
+            delta -= 0x10000
+        ts = (last_tick + delta) << 16
+        self.qxdm_last_ts[radio_idx] = ts
+        return util.parse_qxdm_ts(ts)
+
     def parse_diag_log(self, pkt: "DIAG_LOG_F data without trailing CRC", radio_id = 0):
         if len(pkt) < 16:
+            if self.loss is not None:
+                self.loss.count('truncated', diagstructs.U16.unpack_from(pkt, 6)[0] if len(pkt) >= 8 else None)
             return
 
-        xdm_hdr = pkt[4:16]
-        xdm_hdr = struct.unpack('<HHQ', xdm_hdr) # len, ID, TS
+        xdm_hdr = diagstructs.DIAG_LOG_HEADER.unpack_from(pkt, 4) # len, ID, TS
+        self.qxdm_last_ts[self.sanitize_radio_id(radio_id)] = xdm_hdr[2]
         pkt_ts = util.parse_qxdm_ts(xdm_hdr[2])
         pkt_body = pkt[16:]
 
         if len(pkt_body) != (xdm_hdr[0] - 12):
             self.logger.log(logging.WARNING, "Packet length mismatch: expected {}, got {}".format(xdm_hdr[0], len(pkt_body)))
+            if self.loss is not None and len(pkt_body) < (xdm_hdr[0] - 12):
+                self.loss.count('truncated', xdm_hdr[1])
 
-        if xdm_hdr[1] in self.process.keys():
-            self.process[xdm_hdr[1]](pkt_ts, pkt_body, radio_id)
-        elif xdm_hdr[1] in self.no_process.keys():
-            #print("Not handling XDM Header 0x%04x (%s)" % (xdm_hdr[1], self.no_process[xdm_hdr[1]]))
-            return
+        handler = self.log_dispatch[xdm_hdr[1]]
+        if self.loss is not None:
+            # Decoder failures are counted and the packet dropped
+            try:
+                self.dispatch_log(xdm_hdr[1], len(pkt), handler, pkt_ts, pkt_body, radio_id)
+            except Exception:
+                self.loss.count('exception', xdm_hdr[1])
+                self.logger.log(logging.DEBUG, 'Exception in decoder of log code 0x{:04X}'.format(xdm_hdr[1]), exc_info = True)
         else:
-            #print("Unhandled XDM Header 0x%04x" % xdm_hdr[1])
-            #util.xxd(pkt)
+            self.dispatch_log(xdm_hdr[1], len(pkt), handler, pkt_ts, pkt_body, radio_id)
+
+    def dispatch_log(self, log_code, length, handler, pkt_ts, pkt_body, radio_id):
+        if self.stats is not None:
+            self.stats.call('log', log_code, length, handler, pkt_ts, pkt_body, radio_id)
+        elif handler is not None:
+            handler(pkt_ts, pkt_body, radio_id)
+        else:
+            #print("Unhandled XDM Header 0x%04x" % log_code)
             return
 
     def parse_diag_ext_msg(self, pkt, radio_id):
         # 79 | 00 | 00 | 00 | 00 00 1c fc 0f 16 e4 00 | e6 04 | 94 13 | 02 00 00 00 
         # cmd_code, ts_type, num_args, drop_cnt, TS, Line number, Message subsystem ID, ?
         # Message: two null-terminated strings, one for log and another for filename
-        xdm_hdr = pkt[0:20]
-        xdm_hdr = struct.unpack('<BBBBQHHL', xdm_hdr)
+        xdm_hdr = diagstructs.DIAG_EXT_MSG_HEADER.unpack_from(pkt, 0)
+        self.qxdm_last_ts[self.sanitize_radio_id(radio_id)] = xdm_hdr[4]
+        if self.ssid_list is not None and not (xdm_hdr[6] in self.ssid_list):
+            return
         pkt_ts = util.parse_qxdm_ts(xdm_hdr[4])
-        pkt_body = pkt[20 + 4 * xdm_hdr[2]:]
+        pkt_body = bytes(pkt[20 + 4 * xdm_hdr[2]:])
         pkt_body = pkt_body.rstrip(b'\0').rsplit(b'\0', maxsplit=1)
 
         if len(pkt_body) == 2:
@@ -335,77 +668,71 @@ class QualcommParser:
         if len(pkt) < 8:
             return
 
-        xdm_hdr = pkt[0:8]
-        xdm_hdr = struct.unpack('<BBHL', xdm_hdr) # cmd_id, unknown, dummy, subscription_id
+        xdm_hdr = diagstructs.DIAG_MULTI_RADIO_HEADER.unpack_from(pkt, 0) # cmd_id, unknown, dummy, subscription_id
         pkt_body = pkt[8:]
 
         self.parse_diag(pkt_body, hdlc_encoded=False, check_crc=False, radio_id = (xdm_hdr[3]))
 
     def parse_diag_event(self, pkt, radio_id):
-        cmd_code, len_msg = struct.unpack('<BH', pkt[0:3])
+        cmd_code, len_msg = diagstructs.DIAG_EVENT_REPORT_HEADER.unpack_from(pkt, 0)
 
         pos = 3
         while pos < len(pkt):
+            event_pos = pos
             # id 12b, _pad 1b, payload_len 2b, ts_trunc 1b
-            _eid = struct.unpack('<H', pkt[pos:pos+2])[0]
+            _eid = diagstructs.U16.unpack_from(pkt, pos)[0]
             event_id = _eid & 0xfff
             payload_len = (_eid & 0x6000) >> 13
             ts_trunc = (_eid & 0x8000) >> 15 # 0: 64bit, 1: 16bit TS
             if ts_trunc == 0:
-                ts = struct.unpack('<Q', pkt[pos+2:pos+10])[0]
+                ts = diagstructs.U64.unpack_from(pkt, pos + 2)[0]
+                self.qxdm_last_ts[self.sanitize_radio_id(radio_id)] = ts
                 ts = util.parse_qxdm_ts(ts)
                 pos += 10
             else:
-                #ts = struct.unpack('<H', pkt[pos+2:pos+4])[0]
-                # TODO: correctly parse ts
-                ts = datetime.datetime.now()
+                ts = diagstructs.U16.unpack_from(pkt, pos + 2)[0]
+                ts = self.reconstruct_qxdm_ts(ts, radio_id)
                 pos += 4
 
             assert (payload_len >= 0) and (payload_len <= 3)
             if payload_len == 0:
                 # No payload
-                if event_id in self.process_event.keys():
-                    self.process_event[event_id](radio_id, ts)
-                elif event_id in self.no_process_event.keys():
-                    pass
-                else:
-                    print("Event: {} {}".format(event_id, ts))
+                args = ()
             elif payload_len == 1:
                 # 1x uint8
-                arg1 = pkt[pos]
-
-                if event_id in self.process_event.keys():
-                    self.process_event[event_id](radio_id, ts, arg1)
-                elif event_id in self.no_process_event.keys():
-                    pass
-                else:
-                    print("Event: {} {}: 0x{:02x}".format(event_id, ts, arg1))
+                args = (pkt[pos],)
                 pos += 1
             elif payload_len == 2:
                 # 2x uint8
-                arg1 = pkt[pos]
-                arg2 = pkt[pos+1]
-
-                if event_id in self.process_event.keys():
-                    self.process_event[event_id](radio_id, ts, arg1, arg2)
-                elif event_id in self.no_process_event.keys():
-                    pass
-                else:
-                    print("Event: {} {}: 0x{:02x} 0x{:02x}".format(event_id, ts, arg1, arg2))
+                args = (pkt[pos], pkt[pos+1])
                 pos += 2
             elif payload_len == 3:
                 # Pascal string
                 bin_len = pkt[pos]
-                arg_bin = pkt[pos+1:pos+1+bin_len]
+                args = (pkt[pos+1:pos+1+bin_len],)
+                pos += (1 + bin_len)
+
+            handler = self.event_dispatch[event_id]
+            if self.stats is not None:
+                # Account the whole event, header and payload
+                self.stats.call('event', event_id, pos - event_pos, handler, radio_id, ts, *args)
+            elif handler is not None:
+                handler(radio_id, ts, *args)
+            if handler is not None:
+                continue
 
-                if event_id in self.process_event.keys():
-                    self.process_event[event_id](radio_id, ts, arg_bin)
-                elif event_id in self.no_process_event.keys():
-                    pass
-                else:
-                    print("Event {}: {}: Binary(len=0x{:02x}) = {}"
-                    .format(event_id, ts, bin_len, ' '.join('{:02x}'.format(x) for x in arg_bin)))
-                pos += (1 + pkt[pos])
+            if payload_len == 0:
+                print("Event: {} {}".format(event_id, util.ts_to_datetime(ts)))
+            elif payload_len == 1:
+                print("Event: {} {}: 0x{:02x}".format(event_id, util.ts_to_datetime(ts), args[0]))
+            elif payload_len == 2:
+                print("Event: {} {}: 0x{:02x} 0x{:02x}".format(event_id, util.ts_to_datetime(ts), args[0], args[1]))
+            elif payload_len == 3:
+                print("Event {}: {}: Binary(len=0x{:02x}) = {}"
+                .format(event_id, util.ts_to_datetime(ts), bin_len, args[0].hex(' ')))
+
+    def ignore_event(self, radio_id, ts, *args):
+        pass
 
     def parse_diag_qsr_ext_msg(self, pkt, radio_id):
         pass
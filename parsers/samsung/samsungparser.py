@@ -36,6 +36,9 @@ class SamsungParser:
 
         self.io_device = None
         self.writer = None
+        self.stats = None
+        self.loss = None
+        self.idle = util.IdleBackoff()
 
         self.name = 'samsung'
         self.shortname = 'sec'
@@ -48,6 +51,20 @@ class SamsungParser:
     def set_writer(self, writer):
         self.writer = writer
 
+    def set_stats(self, stats):
+        self.stats = stats
+
+    def set_loss_stats(self, loss):
+        self.loss = loss
+
+    def set_stage_timer(self, timer):
+        # Profiling only: replaces pipeline methods by timed wrappers
+        timer.instrument(self, 'parse_diag', 'dispatch')
+        for attr in ('process_common_basic', 'process_lte_basic_e333',
+                'process_hspa_basic', 'process_ip_data', 'process_common_data',
+                'process_lte_data'):
+            timer.instrument(self, attr, 'decode')
+
     def set_parameter(self, params):
         for p in params:
             if p == 'model':
@@ -123,9 +140,17 @@ class SamsungParser:
     def parse_diag(self, pkt, hdlc_encoded = True, parse_ts = False, radio_id = 0):
         sock_content = b''
         if self.model == 'e333':
-            self.parse_diag_log_e333(pkt, radio_id)
+            parse_diag_log = self.parse_diag_log_e333
         elif self.model == 'e303':
-            self.parse_diag_log_e303(pkt, radio_id)
+            parse_diag_log = self.parse_diag_log_e303
+        else:
+            return
+
+        if self.stats is not None and len(pkt) > 9:
+            # Main command, sub command
+            self.stats.call('sec', (pkt[8], pkt[9]), len(pkt), parse_diag_log, pkt, radio_id)
+        else:
+            parse_diag_log(pkt, radio_id)
 
     def run_diag(self):
         self.logger.log(logging.INFO, 'Starting diag')
@@ -134,10 +159,15 @@ class SamsungParser:
         cur_pos = 0
         try:
             while True:
+                self.idle.begin()
                 buf = self.io_device.read(0x9000)
                 #util.xxd(buf, True)
+                if self.loss is not None:
+                    self.loss.poll(self.writer)
                 if len(buf) == 0:
+                    self.idle.wait()
                     continue
+                self.idle.reset()
                 cur_pos = 0
                 while cur_pos < len(buf):
                     #print('---- subpacket ----')
@@ -145,12 +175,16 @@ class SamsungParser:
                     #assert buf[cur_pos] == 0x7f
                     if buf[cur_pos] != 0x7f:
                         self.logger.log(logging.WARNING, 'Unexpected end of the packet, dropping it')
-                        self.logger.log(logging.DEBUG, util.xxd(buf))
+                        if self.loss is not None:
+                            self.loss.count('truncated')
+                        self.logger.log(logging.DEBUG, util.LazyHexdump(buf))
                         break
                     len_1 = buf[cur_pos + 1] | (buf[cur_pos + 2] << 8)
                     len_2 = buf[cur_pos + 3] | (buf[cur_pos + 4] << 8)
                     #util.xxd(buf[cur_pos:cur_pos+len_1 + 2])
                     #util.xxd(buf[cur_pos: cur_pos + len_1 + 2], True)
+                    if self.loss is not None:
+                        self.loss.received += 1
                     self.parse_diag(buf[cur_pos:cur_pos + len_1 + 2])
                     cur_pos += (len_1 + 2)
                     #print('%s/%s' % (cur_pos, len(buf)))
@@ -410,7 +444,7 @@ class SamsungParser:
                     subtype = rrc_subtype_ul[channel]
             except KeyError:
                 self.logger.log(logging.WARNING, "Unknown LTE RRC channel type %d" % channel)
-                self.logger.log(logging.DEBUG, util.xxd(pkt))
+                self.logger.log(logging.DEBUG, util.LazyHexdump(pkt))
 
             if direction == 0:
                 arfcn = self.lte_last_earfcn_dl[0]
@@ -518,7 +552,7 @@ class SamsungParser:
         if not (pkt[0] == 0x7f and pkt[-1] == 0x7e):
             self.logger.log(logging.WARNING, 'Invalid packet structure')
             #util.xxd(pkt, True)
-            self.logger.log(logging.DEBUG, util.xxd(pkt))
+            self.logger.log(logging.DEBUG, util.LazyHexdump(pkt))
             return
 
         len_1 = pkt[1] | (pkt[2] << 8)
@@ -543,7 +577,7 @@ class SamsungParser:
                 #print('TODO: subcommand %02x' % sub_cmd)
                 pass
             self.logger.log(logging.WARNING, 'TODO: IpcCtCmd')
-            self.logger.log(logging.DEBUG, util.xxd(pkt))
+            self.logger.log(logging.DEBUG, util.LazyHexdump(pkt))
         elif main_cmd == 0xa2: # IpcHimCmd
             self.logger.log(logging.WARNING, 'TODO: IpcHimCmd')
         else:
@@ -581,7 +615,7 @@ class SamsungParser:
 
         if not (pkt[0] == 0x7f and pkt[-1] == 0x7e):
             self.logger.log(logging.WARNING, 'Invalid packet structure')
-            self.logger.log(logging.DEBUG, util.xxd(pkt))
+            self.logger.log(logging.DEBUG, util.LazyHexdump(pkt))
             return
 
         len_1 = pkt[1] | (pkt[2] << 8)
@@ -6,6 +6,7 @@ __version__ = "0.9"
 import iodevices
 import writers
 import parsers
+import stats
 
 import os, sys, re, importlib
 import argparse
@@ -14,8 +15,11 @@ import struct
 import util
 import faulthandler
 import logging
+import cProfile
+import pstats
 
 current_parser = None
+parser_stats = None
 logger = logging.getLogger('scat')
 
 if os.name != 'nt':
@@ -26,6 +30,11 @@ def sigint_handler(signal, frame):
     current_parser.stop_diag()
     sys.exit(0)
 
+def sigusr2_handler(signal, frame):
+    global parser_stats
+    if parser_stats is not None:
+        parser_stats.dump()
+
 def hexint(string):
     if string[0:2] == '0x' or string[0:2] == '0X':
         return int(string[2:], 16)
@@ -52,6 +61,7 @@ if __name__ == '__main__':
     input_group.add_argument('-s', '--serial', help='Use serial diagnostic port')
     input_group.add_argument('-u', '--usb', action='store_true', help='Use USB diagnostics port')
     input_group.add_argument('-d', '--dump', help='Read from baseband dump (QMDL)', nargs='*')
+    parser.add_argument('--survey', action='store_true', help='Only count frames, log codes, versions and time span per dump file, without decoding (requires --dump)')
 
     usb_group = parser.add_argument_group('USB device settings')
     usb_group.add_argument('-v', '--vendor', help='Specify USB vendor ID', type=hexint)
@@ -59,6 +69,11 @@ if __name__ == '__main__':
     usb_group.add_argument('-a', '--address', help='Specify USB device address(bus:address)', type=str)
     usb_group.add_argument('-c', '--config', help='Specify USB configuration number for DM port', type=int, default=-1)
     usb_group.add_argument('-i', '--interface', help='Specify USB interface number for DM port', type=int, default=2)
+    usb_group.add_argument('--usb-reader', action='store_true', help='Read the DM port from a background thread into a ring buffer')
+    usb_group.add_argument('--usb-buffer-size', help='Ring buffer size in KiB for --usb-reader', type=int, default=4096)
+    usb_group.add_argument('--usb-high-water', help='Ring buffer fill ratio above which a warning is logged', type=float, default=0.75)
+    usb_group.add_argument('--usb-transfers', help='Number of asynchronous bulk-IN transfers kept in flight through libusb-1.0, implies --usb-reader', type=int, default=0)
+    usb_group.add_argument('--usb-transfer-size', help='Size in KiB of each bulk-IN transfer for --usb-reader', type=int, default=16)
 
     if 'qc' in parser_dict.keys():
         qc_group = parser.add_argument_group('Qualcomm specific settings')
@@ -67,6 +82,8 @@ if __name__ == '__main__':
         qc_group.add_argument('--qsr4-hash', help='Specify QSR4 message hash file (need to obtain from the device firmware), implies --msgs', type=str)
         qc_group.add_argument('--events', action='store_true', help='Decode Events as GSMTAP logging')
         qc_group.add_argument('--msgs', action='store_true', help='Decode Extended Message Reports and QSR Message Reports as GSMTAP logging')
+        qc_group.add_argument('--log-codes', help='Enable and decode only the log codes, event IDs ("event ID") and message SSIDs ("ssid ID") listed in specified file, one per line', type=str)
+        qc_group.add_argument('--crc-sample', help='Verify CRC16 of every Nth frame only, 0 disables the check (for trusted dumps)', type=int, default=1)
 
     if 'sec' in parser_dict.keys():
         sec_group = parser.add_argument_group('Samsung specific settings')
@@ -79,6 +96,21 @@ if __name__ == '__main__':
 
     ip_group.add_argument('-F', '--pcap-file', help='Write GSMTAP packets directly to specified PCAP file')
 
+    stats_group = parser.add_argument_group('Statistics')
+    stats_group.add_argument('--stats', action='store_true', help='Count packets, bytes, parse time and exceptions per log code, event ID and command; dumped at exit and on SIGUSR2')
+    stats_group.add_argument('--stats-file', help='Periodically write statistics to specified file, implies --stats', type=str)
+    stats_group.add_argument('--stats-interval', help='Interval in seconds between writes of the statistics file', type=float, default=10.0)
+    stats_group.add_argument('--profile', help='Run under cProfile and save the profile to specified file, print time per pipeline stage and hottest functions at exit', type=str)
+    stats_group.add_argument('--latency', action='store_true', help='Measure latency between device timestamp and output per log code, reported with the statistics, implies --stats')
+    stats_group.add_argument('--latency-window', help='Number of recent packets per log code kept for latency percentiles', type=int, default=1024)
+    stats_group.add_argument('--loss', action='store_true', help='Count device drops, CRC failures, truncated frames, USB errors and decoder exceptions, report the loss ratio at exit')
+    stats_group.add_argument('--loss-interval', help='Interval in seconds between loss summary records in the GSMTAP output, 0 disables them', type=float, default=60.0)
+    stats_group.add_argument('--memory-watchdog', action='store_true', help='Trace allocations with tracemalloc and periodically log RSS, top allocation sites and retained parser buffers')
+    stats_group.add_argument('--memory-interval', help='Interval in seconds between memory reports', type=float, default=60.0)
+    stats_group.add_argument('--memory-limit', help='Warn whenever the RSS exceeds specified size in MiB, implies --memory-watchdog', type=float, default=0)
+    stats_group.add_argument('--memory-top', help='Number of top allocation sites in memory reports', type=int, default=10)
+    stats_group.add_argument('--metrics-port', help='Serve Prometheus-style metrics on http://127.0.0.1:PORT/metrics, implies --stats', type=int)
+
     args = parser.parse_args()
 
     GSMTAP_IP = args.hostname
@@ -89,6 +121,14 @@ if __name__ == '__main__':
         print('Error: invalid baseband type specified. Available modules: %s' % parsers_desc)
         sys.exit(0)
 
+    if args.survey:
+        if not args.dump:
+            print('Error: --survey requires --dump.')
+            sys.exit(0)
+        if not hasattr(parser_dict[args.type], 'survey_dump'):
+            print('Error: --survey is not supported for baseband type %s.' % args.type)
+            sys.exit(0)
+
     # Device preparation
     io_device = None
     if args.serial:
@@ -115,7 +155,9 @@ if __name__ == '__main__':
         sys.exit(0)
 
     # Writer preparation
-    if args.pcap_file == None:
+    if args.survey:
+        writer = writers.NullWriter()
+    elif args.pcap_file == None:
         writer = writers.SocketWriter(GSMTAP_IP, GSMTAP_PORT, IP_OVER_UDP_PORT)
     else:
         writer = writers.PcapWriter(args.pcap_file, GSMTAP_PORT, IP_OVER_UDP_PORT)
@@ -124,6 +166,35 @@ if __name__ == '__main__':
     current_parser.set_io_device(io_device)
     current_parser.set_writer(writer)
 
+    if args.stats or args.stats_file or args.metrics_port or args.latency:
+        parser_stats = stats.ParserStats()
+        if args.latency:
+            writer = writers.LatencyWriter(writer, parser_stats, args.latency_window)
+            parser_stats.set_latency(writer)
+            current_parser.set_writer(writer)
+        current_parser.set_stats(parser_stats)
+        parser_stats.set_idle(current_parser.idle)
+        if os.name != 'nt':
+            signal.signal(signal.SIGUSR2, sigusr2_handler)
+        if args.stats_file:
+            parser_stats.start_periodic_dump(args.stats_file, args.stats_interval)
+
+    loss_stats = None
+    if args.loss:
+        loss_stats = stats.LossStats(args.loss_interval)
+        loss_stats.set_parser(current_parser)
+        loss_stats.set_io_device(io_device)
+        current_parser.set_loss_stats(loss_stats)
+
+    metrics_server = None
+    if args.metrics_port:
+        metrics_server = stats.MetricsServer(args.metrics_port)
+        metrics_server.set_parser(current_parser)
+        metrics_server.set_io_device(io_device)
+        metrics_server.set_stats(parser_stats)
+        metrics_server.set_loss_stats(loss_stats)
+        metrics_server.start()
+
     if args.debug:
         logger.setLevel(logging.DEBUG)
         current_parser.set_parameter({'log_level': logging.DEBUG})
@@ -140,26 +211,81 @@ if __name__ == '__main__':
             'qsr-hash': args.qsr_hash,
             'qsr4-hash': args.qsr4_hash,
             'events': args.events,
-            'msgs': args.msgs})
+            'msgs': args.msgs,
+            'crc-sample': args.crc_sample,
+            'log-codes': args.log_codes})
     elif args.type == 'sec':
         current_parser.set_parameter({'model': args.model})
 
+    memory_watchdog = None
+    if args.memory_watchdog or args.memory_limit > 0:
+        memory_watchdog = stats.MemoryWatchdog(args.memory_interval,
+                int(args.memory_limit * 1048576), args.memory_top)
+        memory_watchdog.set_parser(current_parser)
+        memory_watchdog.start()
+
+    stage_timer = None
+    profiler = None
+    if args.profile:
+        stage_timer = stats.StageTimer()
+        stage_timer.instrument(io_device, 'read', 'io read')
+        stage_timer.instrument(writer, 'write_cp', 'writer')
+        stage_timer.instrument(writer, 'write_up', 'writer')
+        for attr, name in (('unwrap', 'deframe'), ('hdlc_scan_frames', 'deframe'),
+                ('dm_crc16', 'crc'), ('dm_crc16_check_batch', 'crc'),
+                ('create_gsmtap_header', 'gsmtap header'),
+                ('create_osmocore_logging_header', 'osmocore header')):
+            stage_timer.instrument(util, attr, name)
+        current_parser.set_stage_timer(stage_timer)
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
     # Run process
-    if args.serial or args.usb:
-        current_parser.stop_diag()
-        current_parser.init_diag()
-        current_parser.prepare_diag()
+    try:
+        if args.serial or args.usb:
+            current_parser.stop_diag()
+            current_parser.init_diag()
+            current_parser.prepare_diag()
 
-        signal.signal(signal.SIGINT, sigint_handler)
+            signal.signal(signal.SIGINT, sigint_handler)
 
-        if not (args.qmdl == None) and args.type == 'qc':
-            current_parser.run_diag(RawWriter(args.qmdl))
-        else:
-            current_parser.run_diag()
+            if args.usb and (args.usb_reader or args.usb_transfers > 0):
+                io_device.start_reader(args.usb_buffer_size * 1024, args.usb_high_water,
+                    transfer_size = args.usb_transfer_size * 1024, transfers = args.usb_transfers)
 
-        current_parser.stop_diag()
-    elif args.dump:
-        current_parser.read_dump()
-    else:
-        assert('Invalid input handler?')
-        sys.exit(0)
+            if not (args.qmdl == None) and args.type == 'qc':
+                current_parser.run_diag(writers.RawWriter(args.qmdl))
+            else:
+                current_parser.run_diag()
+
+            current_parser.stop_diag()
+        elif args.survey:
+            survey = stats.DumpSurvey()
+            current_parser.survey_dump(survey)
+            survey.dump()
+        elif args.dump:
+            current_parser.read_dump()
+        else:
+            assert('Invalid input handler?')
+            sys.exit(0)
+    finally:
+        if args.usb:
+            io_device.stop_reader()
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            stage_timer.dump()
+            pstats.Stats(profiler, stream = sys.stderr).sort_stats('tottime').print_stats(20)
+        if loss_stats is not None:
+            loss_stats.dump()
+        if memory_watchdog is not None:
+            memory_watchdog.stop()
+            memory_watchdog.dump()
+        if metrics_server is not None:
+            metrics_server.stop()
+        if parser_stats is not None:
+            parser_stats.stop_periodic_dump()
+            if args.stats_file:
+                parser_stats.write_file(args.stats_file)
+            parser_stats.dump()
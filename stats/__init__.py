@@ -0,0 +1,9 @@
+#!/usr/bin/env python3
+# coding: utf8
+
+from .parserstats import ParserStats
+from .metricsserver import MetricsServer
+from .stagetimer import StageTimer
+from .memorywatchdog import MemoryWatchdog
+from .dumpsurvey import DumpSurvey
+from .lossstats import LossStats
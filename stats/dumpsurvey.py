@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# coding: utf8
+
+import sys
+import time
+
+import util
+
+class DumpSurvey:
+    # Header-only summary of dump files: per file, counts and bytes per
+    # DIAG command, per log code and log packet version, and the span of
+    # the log packet timestamps. Filled by the parser's survey_dump().
+
+    def __init__(self):
+        self.files = []
+        self.current = None
+
+    def start_file(self, fname):
+        self.current = {
+            'name': fname,
+            'start_time': time.monotonic(),
+            'elapsed': 0,
+            'file_bytes': 0,
+            # DIAG command: [frames, bytes]
+            'commands': { },
+            # (log code, version): [packets, bytes], version None for empty bodies
+            'logs': { },
+            'ts_min': None,
+            'ts_max': None,
+        }
+        self.files.append(self.current)
+
+    def end_file(self, file_bytes = 0):
+        self.current['elapsed'] = time.monotonic() - self.current['start_time']
+        self.current['file_bytes'] = file_bytes
+
+    def format_file(self, entry):
+        lines = []
+        elapsed = entry['elapsed']
+        lines.append('{}: {:.1f} MB in {:.2f} s ({:.1f} MB/s)'.format(entry['name'],
+            entry['file_bytes'] / 1e6, elapsed, entry['file_bytes'] / 1e6 / elapsed if elapsed > 0 else 0))
+
+        if entry['ts_min'] is not None:
+            ts_min = util.parse_qxdm_ts(entry['ts_min'])
+            ts_max = util.parse_qxdm_ts(entry['ts_max'])
+            lines.append('Time span: {} - {} ({:.1f} s)'.format(
+                util.ts_to_datetime(ts_min), util.ts_to_datetime(ts_max), (ts_max - ts_min) / 1e9))
+
+        lines.append('{:>8s} {:>10s} {:>12s}'.format('Command', 'Frames', 'Bytes'))
+        for cmd, (count, length) in sorted(entry['commands'].items()):
+            lines.append('    0x{:02x} {:10d} {:12d}'.format(cmd, count, length))
+
+        logs = { }
+        for (log_code, version), (count, length) in entry['logs'].items():
+            log = logs.setdefault(log_code, [0, 0, { }])
+            log[0] += count
+            log[1] += length
+            log[2][version] = count
+
+        lines.append('{:>8s} {:>10s} {:>12s}  {}'.format('Log code', 'Packets', 'Bytes', 'Versions (packets)'))
+        for log_code, (count, length, versions) in sorted(logs.items(), key = lambda x: x[1][1], reverse = True):
+            version_str = ', '.join('{}: {}'.format(x if x is not None else '-', y)
+                for x, y in sorted(versions.items(), key = lambda x: -1 if x[0] is None else x[0]))
+            lines.append('  0x{:04X} {:10d} {:12d}  {}'.format(log_code, count, length, version_str))
+        return '\n'.join(lines)
+
+    def format(self):
+        return '\n\n'.join(self.format_file(x) for x in self.files)
+
+    def dump(self, f = None):
+        if f is None:
+            f = sys.stdout
+        f.write(self.format() + '\n')
+        f.flush()
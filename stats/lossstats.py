@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# coding: utf8
+
+import sys
+import time
+
+import util
+
+class LossStats:
+    # Counts what was lost on the way from the modem to the output, per
+    # cause and log code (None where the source is unknown):
+    # 'device': drops reported by the modem (extended message drop_cnt, keyed by SSID)
+    # 'truncated': frames too short to hold a command, or shorter than their header claims
+    # 'exception': packets whose decoder raised
+    # Frames failing the CRC16 check are counted as 'crc' but still decoded,
+    # so they are reported next to the loss and not part of it.
+    # USB errors, bytes dropped on USB read buffer overruns and bytes dropped
+    # while resynchronizing the HDLC stream are read from the I/O device and
+    # the deframer when reporting. Received frames are read from the deframer,
+    # parsers without one count them in received.
+    CAUSES = ('device', 'truncated', 'exception')
+
+    def __init__(self, interval = 60.0):
+        self.counters = { }
+        self.received = 0
+        self.interval = interval
+        self.parser = None
+        self.io_device = None
+        self.start_time = time.monotonic()
+        self.next_record = self.start_time + interval if interval > 0 else None
+
+    def set_parser(self, parser):
+        self.parser = parser
+
+    def set_io_device(self, io_device):
+        self.io_device = io_device
+
+    def count(self, cause, key = None, n = 1):
+        self.counters[(cause, key)] = self.counters.get((cause, key), 0) + n
+
+    def totals(self):
+        totals = dict.fromkeys(LossStats.CAUSES + ('crc',), 0)
+        for (cause, key), n in list(self.counters.items()):
+            totals[cause] += n
+
+        deframer = getattr(self.parser, 'deframer', None)
+        totals['frames'] = deframer.frames if deframer is not None else self.received
+        totals['resync bytes'] = deframer.dropped_bytes if deframer is not None else 0
+        totals['usb errors'] = getattr(self.io_device, 'read_errors', 0)
+        totals['overrun bytes'] = getattr(self.io_device, 'overrun_bytes', 0)
+        return totals
+
+    def loss_ratio(self, totals):
+        # Lost packets over received frames plus the ones the modem dropped
+        lost = sum(totals[x] for x in LossStats.CAUSES)
+        seen = totals['frames'] + totals['device']
+        return lost / seen if seen > 0 else 0.0
+
+    def format_summary(self):
+        totals = self.totals()
+        return 'frames {} device {} crc {} truncated {} exception {} usb errors {} overrun bytes {} resync bytes {} loss {:.4%}'.format(
+            totals['frames'], totals['device'], totals['crc'], totals['truncated'],
+            totals['exception'], totals['usb errors'], totals['overrun bytes'], totals['resync bytes'], self.loss_ratio(totals))
+
+    def format_key(self, cause, key):
+        if key is None:
+            return '-'
+        elif cause == 'device':
+            return 'SSID {}'.format(key)
+        else:
+            return '0x{:04X}'.format(key)
+
+    def format(self):
+        lines = ['Loss after {:.1f} s: {}'.format(time.monotonic() - self.start_time, self.format_summary())]
+        entries = sorted(list(self.counters.items()), key = lambda x: x[1], reverse = True)
+        if entries:
+            lines.append('{:10s} {:>12s} {:>10s}'.format('Cause', 'Key', 'Count'))
+        for (cause, key), n in entries:
+            lines.append('{:10s} {:>12s} {:10d}'.format(cause, self.format_key(cause, key), n))
+        return '\n'.join(lines)
+
+    def dump(self, f = None):
+        if f is None:
+            f = sys.stderr
+        f.write(self.format() + '\n')
+        f.flush()
+
+    def emit_record(self, writer):
+        # Summary as GSMTAP osmocore log record, next to the decoded packets
+        # No device timestamp: kept out of the latency measurement
+        osmocore_log_hdr = util.create_osmocore_logging_header(
+            process_name = 'scat',
+            subsys_name = 'loss')
+        gsmtap_hdr = util.create_gsmtap_header(
+            version = 2,
+            payload_type = util.gsmtap_type.OSMOCORE_LOG)
+        writer.write_cp(gsmtap_hdr + osmocore_log_hdr + self.format_summary().encode('utf-8'), 0, None)
+
+    def poll(self, writer):
+        # Called by the parser between reads, emits a record once per interval
+        if self.next_record is None:
+            return
+        now = time.monotonic()
+        if now >= self.next_record:
+            self.next_record = now + self.interval
+            self.emit_record(writer)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# coding: utf8
+
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def get_rss():
+    # Current resident set size in bytes, peak RSS where /proc is missing
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is not None:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS bytes
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+    return 0
+
+class MemoryWatchdog:
+    # Periodically samples the RSS and a tracemalloc snapshot from a daemon
+    # thread and logs the top allocation sites, the traced memory per source
+    # file and the buffers the parser reports as retained. The report is
+    # logged as a warning while the RSS is above the ceiling.
+
+    def __init__(self, interval = 60.0, rss_limit = 0, top = 10, frames = 1):
+        self.interval = interval
+        self.rss_limit = rss_limit
+        self.top = top
+        self.frames = frames
+        self.parser = None
+        self.logger = logging.getLogger('scat.memorywatchdog')
+
+        self.rss = 0
+        self.rss_peak = 0
+        self.limit_exceeded = 0
+        self.start_time = time.monotonic()
+
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def set_parser(self, parser):
+        self.parser = parser
+
+    def get_retained(self):
+        if self.parser is None:
+            return { }
+        try:
+            return self.parser.get_memory_usage()
+        except AttributeError:
+            return { }
+
+    def update_rss(self):
+        self.rss = get_rss()
+        if self.rss > self.rss_peak:
+            self.rss_peak = self.rss
+
+    def sample(self):
+        self.update_rss()
+
+        if self.rss_limit > 0 and self.rss > self.rss_limit:
+            self.limit_exceeded += 1
+            self.logger.log(logging.WARNING, 'RSS {:.1f} MiB exceeds limit of {:.1f} MiB'.format(
+                self.rss / 1048576, self.rss_limit / 1048576))
+            self.logger.log(logging.WARNING, self.format())
+        else:
+            self.logger.log(logging.INFO, self.format())
+
+    def format(self):
+        lines = ['Memory after {:.1f} s: RSS {:.1f} MiB, peak {:.1f} MiB'.format(
+            time.monotonic() - self.start_time, self.rss / 1048576, self.rss_peak / 1048576)]
+
+        if tracemalloc.is_tracing():
+            traced, traced_peak = tracemalloc.get_traced_memory()
+            lines.append('Traced {:.1f} MiB, peak {:.1f} MiB'.format(
+                traced / 1048576, traced_peak / 1048576))
+
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+            ))
+
+            lines.append('{:>10s} {:>10s}  {}'.format('Size (KiB)', 'Blocks', 'Allocation site'))
+            for stat in snapshot.statistics('lineno')[:self.top]:
+                frame = stat.traceback[0]
+                lines.append('{:10.1f} {:10d}  {}:{}'.format(
+                    stat.size / 1024, stat.count, frame.filename, frame.lineno))
+
+            # Retained memory per parser module and the rest of the pipeline
+            base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            modules = [x for x in snapshot.statistics('filename') if x.traceback[0].filename.startswith(base)]
+            if modules:
+                lines.append('{:>10s} {:>10s}  {}'.format('Size (KiB)', 'Blocks', 'Module'))
+            for stat in modules:
+                filename = stat.traceback[0].filename
+                lines.append('{:10.1f} {:10d}  {}'.format(
+                    stat.size / 1024, stat.count, os.path.relpath(filename, base)))
+
+        retained = self.get_retained()
+        if retained:
+            lines.append('{:>10s}  {}'.format('Size (KiB)', 'Parser buffer'))
+            for name, size in sorted(retained.items(), key = lambda x: x[1], reverse = True):
+                lines.append('{:10.1f}  {}'.format(size / 1024, name))
+
+        return '\n'.join(lines)
+
+    def dump(self, f = None):
+        if f is None:
+            f = sys.stderr
+        self.update_rss()
+        f.write(self.format() + '\n')
+        f.flush()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+        def watch_loop():
+            while not self.stop_event.wait(self.interval):
+                self.sample()
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(target = watch_loop, name = 'scat-memory', daemon = True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
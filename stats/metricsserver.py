@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# coding: utf8
+
+from .parserstats import ParserStats
+
+import http.server
+import threading
+
+class MetricsServer:
+    # Serves the counters in Prometheus text exposition format. All values
+    # are monotonic totals, rates are derived by the scraper (e.g. rate()).
+
+    def __init__(self, port, host = '127.0.0.1'):
+        self.port = port
+        self.host = host
+        self.parser = None
+        self.io_device = None
+        self.stats = None
+        self.loss = None
+
+        self.httpd = None
+        self.thread = None
+
+    def set_parser(self, parser):
+        self.parser = parser
+
+    def set_io_device(self, io_device):
+        self.io_device = io_device
+
+    def set_stats(self, stats):
+        self.stats = stats
+
+    def set_loss_stats(self, loss):
+        self.loss = loss
+
+    def format_metric(self, lines, name, metric_type, help_text, samples):
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} {}'.format(name, metric_type))
+        for labels, value in samples:
+            if labels:
+                label_str = ','.join('{}="{}"'.format(k, v) for k, v in labels)
+                lines.append('{}{{{}}} {}'.format(name, label_str, value))
+            else:
+                lines.append('{} {}'.format(name, value))
+
+    def render(self):
+        lines = []
+
+        if self.io_device is not None:
+            io = self.io_device
+            self.format_metric(lines, 'scat_io_read_bytes_total', 'counter',
+                'Bytes read from the diagnostic device',
+                [((), getattr(io, 'read_bytes', 0))])
+            self.format_metric(lines, 'scat_io_reads_total', 'counter',
+                'Read calls returning data',
+                [((), getattr(io, 'read_count', 0))])
+            self.format_metric(lines, 'scat_io_read_errors_total', 'counter',
+                'Failed reads, e.g. USB errors',
+                [((), getattr(io, 'read_errors', 0))])
+            self.format_metric(lines, 'scat_io_read_timeouts_total', 'counter',
+                'Reads returning no data within the read timeout',
+                [((), getattr(io, 'read_timeouts', 0))])
+            self.format_metric(lines, 'scat_io_write_bytes_total', 'counter',
+                'Bytes written to the diagnostic device',
+                [((), getattr(io, 'write_bytes', 0))])
+            if getattr(io, 'ring', None) is not None:
+                self.format_metric(lines, 'scat_io_buffer_bytes', 'gauge',
+                    'Bytes waiting in the USB read buffer',
+                    [((), io.ring_wr - io.ring_rd)])
+                self.format_metric(lines, 'scat_io_buffer_peak_bytes', 'gauge',
+                    'Highest fill of the USB read buffer',
+                    [((), io.ring_peak)])
+                self.format_metric(lines, 'scat_io_overruns_total', 'counter',
+                    'USB transfers dropped because the read buffer was full',
+                    [((), io.overruns)])
+                self.format_metric(lines, 'scat_io_overrun_bytes_total', 'counter',
+                    'Bytes dropped because the USB read buffer was full',
+                    [((), io.overrun_bytes)])
+
+        if self.parser is not None:
+            deframer = getattr(self.parser, 'deframer', None)
+            if deframer is not None:
+                self.format_metric(lines, 'scat_deframer_frames_total', 'counter',
+                    'HDLC frames extracted from the stream',
+                    [((), deframer.frames)])
+                self.format_metric(lines, 'scat_deframer_dropped_bytes_total', 'counter',
+                    'Bytes discarded while resynchronizing the HDLC stream',
+                    [((), deframer.dropped_bytes)])
+            if hasattr(self.parser, 'crc_mismatches'):
+                self.format_metric(lines, 'scat_crc_mismatches_total', 'counter',
+                    'Frames failing the CRC16 check',
+                    [((), self.parser.crc_mismatches)])
+
+        if self.stats is not None:
+            entries = self.stats.snapshot()
+            labels = [(('type', category), ('key', self.stats.format_key(category, key))) for category, key, _ in entries]
+            self.format_metric(lines, 'scat_parser_packets_total', 'counter',
+                'Packets seen per log code, event ID or command',
+                [(l, x[2][ParserStats.PACKETS]) for l, x in zip(labels, entries)])
+            self.format_metric(lines, 'scat_parser_bytes_total', 'counter',
+                'Bytes seen per log code, event ID or command',
+                [(l, x[2][ParserStats.BYTES]) for l, x in zip(labels, entries)])
+            self.format_metric(lines, 'scat_parser_seconds_total', 'counter',
+                'Time spent in the parser per log code, event ID or command',
+                [(l, '{:.9f}'.format(x[2][ParserStats.TIME_NS] / 1e9)) for l, x in zip(labels, entries)])
+            self.format_metric(lines, 'scat_parser_exceptions_total', 'counter',
+                'Exceptions raised per log code, event ID or command',
+                [(l, x[2][ParserStats.EXCEPTIONS]) for l, x in zip(labels, entries)])
+
+            if self.stats.latency is not None:
+                latency = self.stats.latency
+                samples = []
+                for key, (n, p50, p99, p_max) in sorted(latency.percentiles().items(), key = lambda x: latency.format_key(x[0])):
+                    source = ('source', latency.format_key(key))
+                    samples.append(((source, ('quantile', '0.5')), '{:.6f}'.format(p50 / 1e9)))
+                    samples.append(((source, ('quantile', '0.99')), '{:.6f}'.format(p99 / 1e9)))
+                    samples.append(((source, ('quantile', '1')), '{:.6f}'.format(p_max / 1e9)))
+                self.format_metric(lines, 'scat_latency_seconds', 'gauge',
+                    'Device timestamp to output latency over the last packets per source, relative to the fastest packet',
+                    samples)
+
+            if self.stats.idle is not None:
+                idle = self.stats.idle
+                self.format_metric(lines, 'scat_idle_reads_total', 'counter',
+                    'Reads in the capture loop returning no data',
+                    [((), idle.idle_reads)])
+                self.format_metric(lines, 'scat_idle_seconds_total', 'counter',
+                    'Wall clock time spent in empty reads and idle backoff',
+                    [((), '{:.6f}'.format(idle.idle_ns / 1e9))])
+                self.format_metric(lines, 'scat_idle_cpu_seconds_total', 'counter',
+                    'Process CPU time spent in empty reads and idle backoff',
+                    [((), '{:.6f}'.format(idle.idle_cpu_ns / 1e9))])
+
+        if self.loss is not None:
+            totals = self.loss.totals()
+            self.format_metric(lines, 'scat_lost_packets_total', 'counter',
+                'Packets lost per cause: device drops, truncated frames, decoder exceptions',
+                [((('cause', x),), totals[x]) for x in self.loss.CAUSES])
+            self.format_metric(lines, 'scat_crc_errors_total', 'counter',
+                'Frames failing the CRC check, still decoded',
+                [((), totals['crc'])])
+
+        return '\n'.join(lines) + '\n'
+
+    def start(self):
+        metrics = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer((self.host, self.port), MetricsHandler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target = self.httpd.serve_forever, name = 'scat-metrics', daemon = True)
+        self.thread.start()
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.thread.join()
+            self.httpd = None
+            self.thread = None
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# coding: utf8
+
+import os
+import sys
+import time
+import threading
+
+class ParserStats:
+    # Counters per category and key:
+    # 'log': Qualcomm log code, 'event': Qualcomm event ID,
+    # 'sec': Samsung (main command, sub command)
+    PACKETS = 0
+    BYTES = 1
+    TIME_NS = 2
+    EXCEPTIONS = 3
+
+    def __init__(self):
+        self.counters = { }
+        self.start_time = time.monotonic()
+        # (category, key) of the packet being parsed, None outside of call()
+        self.current = None
+        self.latency = None
+        self.idle = None
+
+        self.dump_thread = None
+        self.dump_stop = threading.Event()
+
+    def get_counter(self, category, key):
+        counter = self.counters.get((category, key))
+        if counter is None:
+            counter = [0, 0, 0, 0]
+            self.counters[(category, key)] = counter
+        return counter
+
+    def call(self, category, key, length, handler, *args):
+        # Unhandled and ignored codes (handler is None) are only counted
+        counter = self.get_counter(category, key)
+        counter[ParserStats.PACKETS] += 1
+        counter[ParserStats.BYTES] += length
+        if handler is None:
+            return None
+
+        previous = self.current
+        self.current = (category, key)
+        start = time.perf_counter_ns()
+        try:
+            return handler(*args)
+        except Exception:
+            counter[ParserStats.EXCEPTIONS] += 1
+            raise
+        finally:
+            counter[ParserStats.TIME_NS] += time.perf_counter_ns() - start
+            self.current = previous
+
+    def set_latency(self, latency):
+        # Latency tracker (writers.LatencyWriter) to be reported along the counters
+        self.latency = latency
+
+    def set_idle(self, idle):
+        # Idle accounting of the capture loop (util.IdleBackoff)
+        self.idle = idle
+
+    def snapshot(self):
+        # May be called from the signal handler or the dump thread while the
+        # parser keeps updating the counters
+        return [(category, key, tuple(counter)) for (category, key), counter in list(self.counters.items())]
+
+    def format_key(self, category, key):
+        if category == 'log':
+            return '0x{:04X}'.format(key)
+        elif category == 'sec':
+            return '0x{:02x}/0x{:02x}'.format(key[0], key[1])
+        else:
+            return str(key)
+
+    def format(self):
+        entries = self.snapshot()
+        entries.sort(key = lambda x: (x[2][ParserStats.TIME_NS], x[2][ParserStats.PACKETS]), reverse = True)
+
+        lines = ['Parser statistics after {:.1f} s'.format(time.monotonic() - self.start_time)]
+        lines.append('{:6s} {:>12s} {:>10s} {:>12s} {:>10s} {:>9s} {:>6s}'.format(
+            'Type', 'Key', 'Packets', 'Bytes', 'Time (ms)', 'Avg (us)', 'Exc'))
+        for category, key, counter in entries:
+            packets, length, time_ns, exceptions = counter
+            lines.append('{:6s} {:>12s} {:10d} {:12d} {:10.1f} {:9.1f} {:6d}'.format(
+                category, self.format_key(category, key), packets, length,
+                time_ns / 1e6, time_ns / packets / 1e3 if packets > 0 else 0, exceptions))
+        if self.latency is not None:
+            lines.append(self.latency.format())
+        if self.idle is not None:
+            lines.append(self.idle.format())
+        return '\n'.join(lines)
+
+    def dump(self, f = None):
+        if f is None:
+            f = sys.stderr
+        f.write(self.format() + '\n')
+        f.flush()
+
+    def write_file(self, filename):
+        # Replace the file atomically so that readers never see a partial dump
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            self.dump(f)
+        os.replace(tmp_filename, filename)
+
+    def start_periodic_dump(self, filename, interval):
+        def dump_loop():
+            while not self.dump_stop.wait(interval):
+                self.write_file(filename)
+
+        self.dump_stop.clear()
+        self.dump_thread = threading.Thread(target = dump_loop, name = 'scat-stats', daemon = True)
+        self.dump_thread.start()
+
+    def stop_periodic_dump(self):
+        if self.dump_thread is not None:
+            self.dump_stop.set()
+            self.dump_thread.join()
+            self.dump_thread = None
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# coding: utf8
+
+import functools
+import sys
+import time
+
+class StageTimer:
+    # Wall clock time per pipeline stage. Functions are wrapped with
+    # instrument(), nested calls are kept on a stack so that the time of an
+    # inner stage (e.g. GSMTAP header build inside a decoder) is not
+    # accounted again for the outer stage.
+    CALLS = 0
+    INCLUSIVE_NS = 1
+    EXCLUSIVE_NS = 2
+
+    def __init__(self):
+        self.stages = { }
+        self.stack = []
+        self.start_time = time.perf_counter_ns()
+
+    def wrap(self, name, func):
+        stage = self.stages.setdefault(name, [0, 0, 0])
+        stack = self.stack
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter_ns()
+            stack.append(0)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter_ns() - start
+                child = stack.pop()
+                stage[0] += 1
+                stage[1] += elapsed
+                stage[2] += elapsed - child
+                if stack:
+                    stack[-1] += elapsed
+
+        return timed
+
+    def instrument(self, obj, attr, name):
+        # Replaces obj.attr, works for module functions and bound methods
+        setattr(obj, attr, self.wrap(name, getattr(obj, attr)))
+
+    def format(self):
+        wall_ns = time.perf_counter_ns() - self.start_time
+        stages = sorted(self.stages.items(), key = lambda x: x[1][StageTimer.EXCLUSIVE_NS], reverse = True)
+        accounted_ns = sum(x[1][StageTimer.EXCLUSIVE_NS] for x in stages)
+
+        lines = ['Pipeline stages after {:.3f} s wall clock time'.format(wall_ns / 1e9)]
+        lines.append('{:16s} {:>10s} {:>12s} {:>12s} {:>9s} {:>7s}'.format(
+            'Stage', 'Calls', 'Self (ms)', 'Total (ms)', 'Avg (us)', 'Share'))
+        for name, (calls, inclusive_ns, exclusive_ns) in stages:
+            lines.append('{:16s} {:10d} {:12.1f} {:12.1f} {:9.2f} {:6.1f}%'.format(
+                name, calls, exclusive_ns / 1e6, inclusive_ns / 1e6,
+                exclusive_ns / calls / 1e3 if calls > 0 else 0,
+                exclusive_ns * 100 / wall_ns if wall_ns > 0 else 0))
+        lines.append('{:16s} {:10s} {:12.1f} {:12s} {:9s} {:6.1f}%'.format(
+            '(other)', '', (wall_ns - accounted_ns) / 1e6, '', '',
+            (wall_ns - accounted_ns) * 100 / wall_ns if wall_ns > 0 else 0))
+        return '\n'.join(lines)
+
+    def dump(self, f = None):
+        if f is None:
+            f = sys.stderr
+        f.write(self.format() + '\n')
+        f.flush()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# coding: utf8
+
+import os
+import sys
+import types
+
+# Modules import each other from the repository root, as scat.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# iodevices and the Qualcomm parser import pyusb and pyserial at module
+# level, the tests use neither: without the real packages, stand-ins with
+# the names used at import time are installed. Stand-ins have no __file__:
+# a test needing a real library has to skip on that, importorskip() alone
+# succeeds against a stand-in.
+def install_stub(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    module.__file__ = None
+    sys.modules[name] = module
+    return module
+
+class StubUSBError(IOError):
+    pass
+
+class StubUSBTimeoutError(StubUSBError):
+    pass
+
+def stub_unavailable(*args, **kwargs):
+    raise OSError('Not available in tests')
+
+try:
+    import usb
+    import usb.core
+    import usb.util
+except ImportError:
+    usb_core = install_stub('usb.core', USBError = StubUSBError, USBTimeoutError = StubUSBTimeoutError,
+        find = stub_unavailable)
+    usb_util = install_stub('usb.util', dispose_resources = lambda dev: None,
+        find_descriptor = stub_unavailable, endpoint_direction = stub_unavailable,
+        ENDPOINT_IN = 0x80, ENDPOINT_OUT = 0x00)
+    install_stub('usb', core = usb_core, util = usb_util)
+
+try:
+    import serial
+except ImportError:
+    install_stub('serial', Serial = stub_unavailable)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# coding: utf8
+
+import unittest
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from parsers.qualcomm.qualcommparser import QualcommParser
+import util
+
+class FakeDump:
+    # Returns the scripted chunks one per read(), no rewind()
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def read(self, read_size):
+        if len(self.chunks) == 0:
+            return b''
+        return self.chunks.pop(0)
+
+class TestDumpFrames(unittest.TestCase):
+    def frames(self, chunks):
+        parser = QualcommParser()
+        parser.io_device = FakeDump(chunks)
+        return parser, [list(x) for x in parser.iter_dump_frames()]
+
+    def test_resync_at_chunk_boundary(self):
+        # Oversized frame ending exactly at the chunk boundary: the frame
+        # after the delimiter opening the next chunk is complete
+        frame = util.generate_packet(b'\x10\x00\x7e\x7d\x01\x02')
+        garbage = b'\x55' * 0x11000
+        parser, frames = self.frames([frame + garbage, b'\x7e' + frame])
+        self.assertEqual([len(x) for x in frames], [1, 1])
+        self.assertEqual(frames[1][0], util.unwrap(frame[:-1]))
+        self.assertEqual(parser.deframer.dropped_bytes, len(garbage))
+
+    def test_resync_within_chunk(self):
+        # The next chunk starts with the tail of the oversized frame
+        frame = util.generate_packet(b'\x10\x00\x01\x02')
+        garbage = b'\x55' * 0x11000
+        parser, frames = self.frames([frame + garbage, b'\x55' * 10 + b'\x7e' + frame])
+        self.assertEqual([len(x) for x in frames], [1, 1])
+        self.assertEqual(frames[1][0], util.unwrap(frame[:-1]))
+        self.assertEqual(parser.deframer.dropped_bytes, len(garbage) + 10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# coding: utf8
+
+import threading
+import time
+import unittest
+
+from iodevices.usbio import USBIO
+from iodevices.libusb1async import AsyncBackend
+
+class FakeBackend(AsyncBackend):
+    # Scripted completions instead of a device: each handle_events() call
+    # runs one step, (index, data) completes and resubmits a transfer,
+    # 'error' fails the oldest transfer, ('fail_submits', n) makes the next
+    # n resubmissions fail and 'no_device' sets the flag
+    def __init__(self, steps):
+        super().__init__()
+        self.steps = list(steps)
+        self.submit_failures = 0
+        self.submitted = None
+        self.written = []
+        self.closed = False
+        self.idle = threading.Event()
+
+    def submit(self, count, size, callback):
+        self.submitted = (count, size)
+        self.callback = callback
+        for index in range(count):
+            self.resubmit(index)
+
+    def resubmit(self, index):
+        if self.submit_failures > 0:
+            self.submit_failures -= 1
+            self.errors += 1
+            self.pending.append(index)
+            return
+        self.queued(index)
+
+    def handle_events(self, timeout):
+        if len(self.steps) == 0:
+            self.idle.set()
+            time.sleep(timeout)
+            return
+        step = self.steps.pop(0)
+        if step == 'no_device':
+            self.no_device = True
+            return
+        elif step == 'error':
+            index = min(self.seqs, key = self.seqs.get)
+            data = None
+            self.errors += 1
+        elif step[0] == 'fail_submits':
+            self.submit_failures = step[1]
+            return
+        else:
+            index, data = step
+        self.done(index, data)
+        if not self.stopping:
+            self.resubmit(index)
+
+    def write(self, data, timeout = 1000):
+        self.written.append(bytes(data))
+        return len(data)
+
+    def close(self):
+        self.stopping = True
+        self.closed = True
+
+def read_all(io, length, timeout = 2.0):
+    buf = b''
+    deadline = time.monotonic() + timeout
+    while len(buf) < length and time.monotonic() < deadline:
+        buf += io.read(0x1000)
+    return buf
+
+class TestUSBAsync(unittest.TestCase):
+    def start(self, steps, transfers = 4):
+        io = USBIO()
+        io.read_timeout = 50
+        backend = FakeBackend(steps)
+        io.start_reader(0x10000, transfer_size = 0x100, timeout = 10, transfers = transfers, backend = backend)
+        return io, backend
+
+    def test_submission_order(self):
+        # Transfers 0-3 are queued as sequence 0-3, completing 2, 0, 3, 1
+        # must still deliver a, b, c, d; the resubmitted transfers follow
+        io, backend = self.start([(2, b'c'), (0, b'a'), (3, b'd'), (1, b'b'),
+            (0, b'f'), (2, b'e')])
+        try:
+            self.assertEqual(backend.submitted, (4, 0x100))
+            self.assertEqual(read_all(io, 6), b'abcdef')
+            self.assertEqual(io.read_bytes, 6)
+        finally:
+            io.stop_reader()
+
+    def test_empty_completion_keeps_order(self):
+        io, backend = self.start([(1, b'b'), (0, b''), (2, b'c')], transfers = 3)
+        try:
+            self.assertEqual(read_all(io, 2), b'bc')
+        finally:
+            io.stop_reader()
+
+    def test_errors_counted(self):
+        # Failed transfers 1 and 3 leave gaps after a and after c
+        io, backend = self.start([(0, b'a'), 'error', (2, b'c'), 'error'])
+        try:
+            self.assertTrue(backend.idle.wait(2.0))
+            # Errors are collected after each handle_events() call
+            time.sleep(0.05)
+            self.assertEqual(io.read_errors, 2)
+            self.assertEqual(io.read(0x1000), b'a')
+            self.assertFalse(io.read_gap)
+            self.assertEqual(io.read(0x1000), b'c')
+            self.assertTrue(io.read_gap)
+            self.assertEqual(list(io.ring_gaps), [2])
+        finally:
+            io.stop_reader()
+
+    def test_failed_resubmit_retried(self):
+        io, backend = self.start([('fail_submits', 1), (0, b'a'), (0, b'b')], transfers = 1)
+        try:
+            self.assertEqual(read_all(io, 2), b'ab')
+            self.assertEqual(backend.pending, [])
+            self.assertTrue(io.reader_thread.is_alive())
+            self.assertEqual(io.read_errors, 1)
+        finally:
+            io.stop_reader()
+
+    def test_no_transfer_left_stops_loop(self):
+        io, backend = self.start([('fail_submits', 1000), (0, b'a'), (0, b'b')], transfers = 1)
+        thread = io.reader_thread
+        thread.join(2.0)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(backend.active, 0)
+        self.assertEqual(read_all(io, 1), b'a')
+        io.stop_reader()
+
+    def test_no_device_stops_loop(self):
+        io, backend = self.start([(0, b'a'), 'no_device', (1, b'b')])
+        thread = io.reader_thread
+        thread.join(2.0)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(read_all(io, 1), b'a')
+        # Steps after the disconnect are never run
+        self.assertEqual(backend.steps, [(1, b'b')])
+        io.stop_reader()
+
+    def test_write_routed_to_backend(self):
+        io, backend = self.start([])
+        try:
+            io.write(b'\x7e\x00\x7e')
+            self.assertEqual(backend.written, [b'\x7e\x00\x7e'])
+            self.assertEqual(io.write_bytes, 3)
+        finally:
+            io.stop_reader()
+
+    def test_stop_closes_backend(self):
+        io, backend = self.start([])
+        io.stop_reader()
+        self.assertTrue(backend.closed)
+        self.assertIsNone(io.backend)
+        self.assertIsNone(io.reader_thread)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# coding: utf8
+
+import os
+import threading
+import time
+import unittest
+
+from iodevices.usbio import USBIO
+import util
+
+class FakeEndpoint:
+    # Bulk-IN endpoint returning the scripted chunks one per transfer.
+    # With wait_for_space, a chunk is only returned once it fits into the
+    # ring, like a device that keeps data until the host reads it.
+    def __init__(self, io, chunks, wait_for_space = False):
+        self.io = io
+        self.chunks = list(chunks)
+        self.wait_for_space = wait_for_space
+        self.exhausted = threading.Event()
+
+    def read(self, transfer, timeout):
+        if len(self.chunks) == 0:
+            self.exhausted.set()
+            time.sleep(timeout / 1000)
+            return 0
+        chunk = self.chunks[0]
+        if self.wait_for_space and len(self.io.ring) - (self.io.ring_wr - self.io.ring_rd) < len(chunk):
+            time.sleep(0.001)
+            return 0
+        self.chunks.pop(0)
+        memoryview(transfer)[0:len(chunk)] = chunk
+        return len(chunk)
+
+class TestUSBRing(unittest.TestCase):
+    def start(self, chunks, capacity, wait_for_space = False):
+        io = USBIO()
+        io.read_timeout = 50
+        io.r_handle = FakeEndpoint(io, chunks, wait_for_space)
+        io.start_reader(capacity, transfer_size = 0x200, timeout = 10)
+        return io
+
+    def test_wrap_around(self):
+        # 100 transfers of 300 bytes through a 1000 byte ring, read in
+        # sizes not aligned to either
+        chunks = [os.urandom(300) for x in range(100)]
+        io = self.start(chunks, 1000, wait_for_space = True)
+        try:
+            buf = b''
+            deadline = time.monotonic() + 5.0
+            while len(buf) < 30000 and time.monotonic() < deadline:
+                buf += io.read(77)
+            self.assertEqual(buf, b''.join(chunks))
+            self.assertEqual(io.overruns, 0)
+            self.assertGreater(io.ring_wr, 10 * len(io.ring))
+        finally:
+            io.stop_reader()
+
+    def test_overrun(self):
+        # Consumer stalls: 3 transfers fit, the remaining 7 are dropped whole
+        chunks = [bytes([x]) * 300 for x in range(10)]
+        io = self.start(chunks, 1000)
+        try:
+            self.assertTrue(io.r_handle.exhausted.wait(2.0))
+            self.assertEqual(io.overruns, 7)
+            self.assertEqual(io.overrun_bytes, 2100)
+            self.assertEqual(io.ring_peak, 900)
+            self.assertEqual(io.read(0x1000), b''.join(chunks[0:3]))
+            self.assertFalse(io.read_gap)
+        finally:
+            io.stop_reader()
+
+    def test_overrun_gap(self):
+        # Reads stop at the dropped transfers, the first read after them is
+        # flagged and the deframer drops the frame spanning the gap
+        chunks = [b'\x01' * 250 + b'\x7e' + b'\x02' * 49] * 3 + [b'\x03' * 300] * 2 + [b'\x04' * 20 + b'\x7e']
+        io = self.start(chunks, 900)
+        try:
+            self.assertTrue(io.r_handle.exhausted.wait(2.0))
+            self.assertEqual(io.overruns, 3)
+            self.assertEqual(io.read(0x1000), b''.join(chunks[0:3]))
+            self.assertFalse(io.read_gap)
+            self.assertEqual(io.read(0x1000), b'')
+            io.r_handle.chunks.append(chunks[5])
+            deadline = time.monotonic() + 2.0
+            buf = b''
+            while len(buf) == 0 and time.monotonic() < deadline:
+                buf = io.read(0x1000)
+            self.assertEqual(buf, chunks[5])
+            self.assertTrue(io.read_gap)
+
+            deframer = util.HdlcDeframer()
+            self.assertEqual(len(deframer.feed(b''.join(chunks[0:3]))), 3)
+            deframer.discard()
+            self.assertEqual(deframer.feed(buf), [])
+            self.assertEqual(deframer.dropped_bytes, 49 + 20)
+        finally:
+            io.stop_reader()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,52 +3,54 @@
 
 import struct
 import datetime
+import time
+import binascii
 import sys
 import string
+import functools
 from enum import IntEnum, unique
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 XXD_SET = string.ascii_letters + string.digits + string.punctuation
 
-crc_table = [
-    0x0000, 0x1189, 0x2312, 0x329b, 0x4624, 0x57ad, 0x6536, 0x74bf,
-    0x8c48, 0x9dc1, 0xaf5a, 0xbed3, 0xca6c, 0xdbe5, 0xe97e, 0xf8f7,
-    0x1081, 0x0108, 0x3393, 0x221a, 0x56a5, 0x472c, 0x75b7, 0x643e,
-    0x9cc9, 0x8d40, 0xbfdb, 0xae52, 0xdaed, 0xcb64, 0xf9ff, 0xe876,
-    0x2102, 0x308b, 0x0210, 0x1399, 0x6726, 0x76af, 0x4434, 0x55bd,
-    0xad4a, 0xbcc3, 0x8e58, 0x9fd1, 0xeb6e, 0xfae7, 0xc87c, 0xd9f5,
-    0x3183, 0x200a, 0x1291, 0x0318, 0x77a7, 0x662e, 0x54b5, 0x453c,
-    0xbdcb, 0xac42, 0x9ed9, 0x8f50, 0xfbef, 0xea66, 0xd8fd, 0xc974,
-    0x4204, 0x538d, 0x6116, 0x709f, 0x0420, 0x15a9, 0x2732, 0x36bb,
-    0xce4c, 0xdfc5, 0xed5e, 0xfcd7, 0x8868, 0x99e1, 0xab7a, 0xbaf3,
-    0x5285, 0x430c, 0x7197, 0x601e, 0x14a1, 0x0528, 0x37b3, 0x263a,
-    0xdecd, 0xcf44, 0xfddf, 0xec56, 0x98e9, 0x8960, 0xbbfb, 0xaa72,
-    0x6306, 0x728f, 0x4014, 0x519d, 0x2522, 0x34ab, 0x0630, 0x17b9,
-    0xef4e, 0xfec7, 0xcc5c, 0xddd5, 0xa96a, 0xb8e3, 0x8a78, 0x9bf1,
-    0x7387, 0x620e, 0x5095, 0x411c, 0x35a3, 0x242a, 0x16b1, 0x0738,
-    0xffcf, 0xee46, 0xdcdd, 0xcd54, 0xb9eb, 0xa862, 0x9af9, 0x8b70,
-    0x8408, 0x9581, 0xa71a, 0xb693, 0xc22c, 0xd3a5, 0xe13e, 0xf0b7,
-    0x0840, 0x19c9, 0x2b52, 0x3adb, 0x4e64, 0x5fed, 0x6d76, 0x7cff,
-    0x9489, 0x8500, 0xb79b, 0xa612, 0xd2ad, 0xc324, 0xf1bf, 0xe036,
-    0x18c1, 0x0948, 0x3bd3, 0x2a5a, 0x5ee5, 0x4f6c, 0x7df7, 0x6c7e,
-    0xa50a, 0xb483, 0x8618, 0x9791, 0xe32e, 0xf2a7, 0xc03c, 0xd1b5,
-    0x2942, 0x38cb, 0x0a50, 0x1bd9, 0x6f66, 0x7eef, 0x4c74, 0x5dfd,
-    0xb58b, 0xa402, 0x9699, 0x8710, 0xf3af, 0xe226, 0xd0bd, 0xc134,
-    0x39c3, 0x284a, 0x1ad1, 0x0b58, 0x7fe7, 0x6e6e, 0x5cf5, 0x4d7c,
-    0xc60c, 0xd785, 0xe51e, 0xf497, 0x8028, 0x91a1, 0xa33a, 0xb2b3,
-    0x4a44, 0x5bcd, 0x6956, 0x78df, 0x0c60, 0x1de9, 0x2f72, 0x3efb,
-    0xd68d, 0xc704, 0xf59f, 0xe416, 0x90a9, 0x8120, 0xb3bb, 0xa232,
-    0x5ac5, 0x4b4c, 0x79d7, 0x685e, 0x1ce1, 0x0d68, 0x3ff3, 0x2e7a,
-    0xe70e, 0xf687, 0xc41c, 0xd595, 0xa12a, 0xb0a3, 0x8238, 0x93b1,
-    0x6b46, 0x7acf, 0x4854, 0x59dd, 0x2d62, 0x3ceb, 0x0e70, 0x1ff9,
-    0xf78f, 0xe606, 0xd49d, 0xc514, 0xb1ab, 0xa022, 0x92b9, 0x8330,
-    0x7bc7, 0x6a4e, 0x58d5, 0x495c, 0x3de3, 0x2c6a, 0x1ef1, 0x0f78
-    ]
+# CRC-16/X.25 used by DIAG is the bit-reflected form of CRC-CCITT. Reflecting
+# every input byte and the result lets binascii.crc_hqx do the work in C.
+crc_reflect_table = bytes(int('{:08b}'.format(x)[::-1], 2) for x in range(256))
+
+# binascii.crc_hqx() of a reflected frame including its valid CRC16
+CRC_HQX_GOOD_RESIDUE = 0x1d0f
 
 def dm_crc16(arr):
-    ret = 0xffff
-    for b in arr:
-        ret = (ret >> 8) ^ crc_table[(ret ^ b) & 0xff]
-    return ret ^ 0xffff
+    crc = binascii.crc_hqx(bytes(arr).translate(crc_reflect_table), 0xffff)
+    return ((crc_reflect_table[crc & 0xff] << 8) | crc_reflect_table[crc >> 8]) ^ 0xffff
+
+def dm_crc16_check_batch(frames, sample_interval = 1, phase = 0):
+    # Verifies CRC16 of frames which still carry their trailing CRC.
+    # Only every sample_interval-th frame is checked (0 disables checking),
+    # phase is the number of frames already seen by the caller.
+    # Returns a list of booleans, unchecked frames are reported as valid.
+    results = [True] * len(frames)
+    if sample_interval < 1 or len(frames) == 0:
+        return results
+
+    first = (-phase) % sample_interval
+    indices = range(first, len(frames), sample_interval)
+    if len(indices) == 0:
+        return results
+
+    joined = b''.join([frames[i] for i in indices]).translate(crc_reflect_table)
+    pos = 0
+    with memoryview(joined) as view:
+        for i in indices:
+            end = pos + len(frames[i])
+            if (end - pos) < 2 or binascii.crc_hqx(view[pos:end], 0xffff) != CRC_HQX_GOOD_RESIDUE:
+                results[i] = False
+            pos = end
+    return results
 
 def wrap(arr):
     t = arr.replace(b'\x7d', b'\x7d\x5d')
@@ -60,6 +62,122 @@ def unwrap(arr):
     t = t.replace(b'\x7d\x5d', b'\x7d')
     return t
 
+class HdlcDeframer:
+    # Stateful HDLC deframer for DIAG streams
+    # Input chunks are appended to a preallocated buffer, complete frames
+    # between 0x7E delimiters are returned unescaped, and the partial trailing
+    # frame stays in place until the next chunk arrives.
+
+    def __init__(self, size = 0x10000, max_frame_size = 0x10000):
+        self.buf = bytearray(size)
+        self.max_frame_size = max_frame_size
+        self.reset()
+
+    def reset(self):
+        self.rd = 0
+        self.wr = 0
+        self.resync = False
+        self.frames = 0
+        self.dropped_bytes = 0
+
+    def _reserve(self, length):
+        pending = self.wr - self.rd
+        if self.wr + length <= len(self.buf):
+            return
+        if pending + length > len(self.buf):
+            new_buf = bytearray(max(len(self.buf) * 2, pending + length))
+            new_buf[0:pending] = self.buf[self.rd:self.wr]
+            self.buf = new_buf
+        else:
+            self.buf[0:pending] = self.buf[self.rd:self.wr]
+        self.rd = 0
+        self.wr = pending
+
+    def feed(self, data):
+        frames = []
+        length = len(data)
+        if length == 0:
+            return frames
+
+        self._reserve(length)
+        self.buf[self.wr:self.wr + length] = data
+        self.wr += length
+
+        with memoryview(self.buf) as view:
+            pos = self.rd
+            while True:
+                end = self.buf.find(b'\x7e', pos, self.wr)
+                if end < 0:
+                    break
+                if self.resync:
+                    # Remainder of an oversized or corrupted frame
+                    self.dropped_bytes += (end - pos)
+                    self.resync = False
+                elif end > pos:
+                    frame = bytes(view[pos:end])
+                    if frame.find(b'\x7d') >= 0:
+                        frame = unwrap(frame)
+                    frames.append(frame)
+                pos = end + 1
+
+        if self.wr - pos > self.max_frame_size:
+            # No delimiter in sight, drop the garbage and wait for next 0x7E
+            self.dropped_bytes += (self.wr - pos)
+            pos = self.wr
+            self.resync = True
+
+        if pos == self.wr:
+            self.rd = 0
+            self.wr = 0
+        else:
+            self.rd = pos
+        self.frames += len(frames)
+        return frames
+
+    def discard(self):
+        # Input is discontinuous (bytes were dropped before the next chunk):
+        # the partial frame and the next chunk up to its first 0x7E can not be
+        # joined, drop both
+        self.dropped_bytes += (self.wr - self.rd)
+        self.rd = 0
+        self.wr = 0
+        self.resync = True
+
+def hdlc_scan_frames(buf):
+    # Vectorised framing of a large buffer, requires NumPy.
+    # Finds every 0x7E delimiter and 0x7D escape at once and unescapes all
+    # complete frames into a single buffer.
+    # Returns (frame data, frame offsets, frame lengths, consumed bytes,
+    # leading delimiter); bytes after the last delimiter are not consumed.
+    # Offsets are into the unescaped frame data, leading delimiter tells
+    # whether buf itself starts with 0x7E, i.e. the first frame is complete.
+    arr = np.frombuffer(buf, dtype=np.uint8)
+    delims = np.flatnonzero(arr == 0x7e)
+    if len(delims) == 0:
+        return b'', np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), 0, False
+
+    consumed = int(delims[-1]) + 1
+    arr = arr[:consumed]
+
+    # 0x7D 0x5E -> 0x7E, 0x7D 0x5D -> 0x7D, other 0x7D are kept as is
+    escapes = np.flatnonzero(arr[:-1] == 0x7d)
+    escapes = escapes[(arr[escapes + 1] == 0x5e) | (arr[escapes + 1] == 0x5d)]
+
+    keep = np.ones(consumed, dtype=bool)
+    keep[delims] = False
+    if len(escapes) > 0:
+        arr = arr.copy()
+        arr[escapes + 1] ^= 0x20
+        keep[escapes] = False
+
+    # Number of kept bytes in front of each delimiter gives frame ends
+    ends = np.cumsum(keep, dtype=np.int64)[delims]
+    offsets = np.concatenate((np.zeros(1, dtype=np.int64), ends[:-1]))
+    lengths = ends - offsets
+    nonempty = lengths > 0
+
+    return arr[keep].tobytes(), offsets[nonempty], lengths[nonempty], consumed, bool(delims[0] == 0)
+
 def generate_packet(arr):
     crc = struct.pack('<H', dm_crc16(arr))
     arr += crc
@@ -67,32 +185,44 @@ def generate_packet(arr):
     arr += b'\x7e'
     return arr
 
+# 1980-01-06 00:00:00 UTC in nanoseconds since Unix epoch
+QXDM_EPOCH_NS = 315964800 * 1000000000
+
 def parse_qxdm_ts(ts):
     # Upper 48 bits: epoch at 1980-01-06 00:00:00, incremented by 1 for 1/800s
     # Lower 16 bits: time since last 1/800s tick in 1/32 chip units
+    # Returns nanoseconds since Unix epoch
 
     ts_upper = (ts >> 16)
     ts_lower = ts & 0xffff
 
-    epoch = datetime.datetime(1980, 1, 6, 0, 0, 0)
-    
-    try:
-        ts_delta = datetime.timedelta(0, 0, 0, ts_upper * 1.25 + ts_lower * (1 / 40960), 0, 0, 0)
-    except OverflowError:
-        ts_delta = datetime.timedelta(seconds=0)
-    return epoch + ts_delta
+    ts_ns = QXDM_EPOCH_NS + ts_upper * 1250000 + (ts_lower * 1000000) // 40960
+    if ts_ns >= (1 << 32) * 1000000000:
+        # Does not fit into 32-bit seconds of PCAP/GSMTAP logging headers
+        ts_ns = QXDM_EPOCH_NS
+    return ts_ns
+
+def ts_to_sec_usec(ts_ns):
+    return ts_ns // 1000000000, (ts_ns // 1000) % 1000000
+
+def ts_to_datetime(ts_ns):
+    # Naive UTC datetime, only for human readable output
+    return datetime.datetime(1970, 1, 1) + datetime.timedelta(microseconds = ts_ns // 1000)
+
+# Printable characters keep their value, everything else becomes '.'
+XXD_TABLE = bytes((x if chr(x) in XXD_SET else ord('.')) for x in range(256))
+
+def _xxd_str(buf):
+    buf = bytes(buf)
+    lines = []
+    for i in range(0, len(buf), 16):
+        line = buf[i:i+16]
+        lines.append(line.hex(' ').ljust(47) + '\t' + line.translate(XXD_TABLE).decode('ascii'))
+    lines.append('-------- end --------')
+    return '\n'.join(lines)
 
 def xxd(buf, stdout = False):
-    xxd_str = ''
-    i = 0
-    while i < len(buf):
-        if (i + 16) < len(buf):
-            xxd_str += (' '.join(('%02x' % x) for x in buf[i:i+16])) + '\t' + (''.join((chr(x) if chr(x) in XXD_SET else '.') for x in buf[i:i+16]))
-        else:
-            xxd_str += (' '.join(('%02x' % x) for x in buf[i:len(buf)])) + '   ' * (16 - (len(buf) - i)) + '\t' + (''.join((chr(x) if chr(x) in XXD_SET else '.') for x in buf[i:len(buf)]))
-        xxd_str += '\n'
-        i += 16
-    xxd_str += '-------- end --------'
+    xxd_str = _xxd_str(buf)
 
     if stdout:
         print(xxd_str)
@@ -100,16 +230,71 @@ def xxd(buf, stdout = False):
         return 'Hexdump: \n' + xxd_str
 
 def xxd_oneline(buf, stdout = False):
-    xxd_str = ''
-    xxd_str += ' '.join(('%02x' % x) for x in buf)
-    xxd_str += '\n'
-    xxd_str += '-------- end --------'
+    xxd_str = bytes(buf).hex(' ') + '\n-------- end --------'
 
     if stdout:
         print(xxd_str)
     else:
         return 'Hexdump: \n' + xxd_str
 
+class LazyHexdump:
+    # Defers xxd() until the log record is actually formatted, so that
+    # self.logger.log(logging.DEBUG, util.LazyHexdump(pkt)) costs next to
+    # nothing while DEBUG is disabled
+    __slots__ = ('buf', 'oneline')
+
+    def __init__(self, buf, oneline = False):
+        self.buf = buf
+        self.oneline = oneline
+
+    def __str__(self):
+        if self.oneline:
+            return xxd_oneline(self.buf)
+        return xxd(self.buf)
+
+class IdleBackoff:
+    # Idle strategy for the live capture loops. The I/O devices block for
+    # up to their read timeout; reads still coming back empty are followed
+    # by a sleep growing exponentially from min_delay to max_delay, reset by
+    # the next read returning data. Wall clock and CPU time spent in empty
+    # reads and sleeps are accounted for the statistics.
+
+    def __init__(self, min_delay = 0.001, max_delay = 0.05):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.delay = 0
+        self.read_start = (0, 0)
+
+        self.idle_reads = 0
+        self.idle_ns = 0
+        self.idle_cpu_ns = 0
+
+    def begin(self):
+        # Called before each read
+        self.read_start = (time.perf_counter_ns(), time.process_time_ns())
+
+    def reset(self):
+        # Called when the read returned data
+        self.delay = 0
+
+    def wait(self):
+        # Called when the read returned no data
+        if self.delay > 0:
+            time.sleep(self.delay)
+        self.delay = min(max(self.delay * 2, self.min_delay), self.max_delay)
+
+        start_ns, start_cpu_ns = self.read_start
+        self.idle_reads += 1
+        self.idle_ns += time.perf_counter_ns() - start_ns
+        self.idle_cpu_ns += time.process_time_ns() - start_cpu_ns
+
+    def cpu_ratio(self):
+        return self.idle_cpu_ns / self.idle_ns if self.idle_ns > 0 else 0.0
+
+    def format(self):
+        return 'Idle {:.1f} s in {} empty reads, CPU {:.3f} s ({:.2%})'.format(
+            self.idle_ns / 1e9, self.idle_reads, self.idle_cpu_ns / 1e9, self.cpu_ratio())
+
 # Definition copied from libosmocore's include/osmocom/core/gsmtap.h
 
 @unique
@@ -238,21 +423,49 @@ class gsmtap_lte_rrc_types(IntEnum):
     PCCH_NB = 21
     SC_MCCH_NB = 22
 
+gsmtap_v2_hdr = struct.Struct('!BBBBHBBLBBBB')
+gsmtap_v3_hdr = struct.Struct('!BBBBHBBLBBBBQL')
+
 def create_gsmtap_header(version = 2, payload_type = 0, timeslot = 0,
     arfcn = 0, signal_dbm = 0, snr_db = 0, frame_number = 0,
     sub_type = 0, antenna_nr = 0, sub_slot = 0,
     device_sec = 0, device_usec = 0):
 
-    gsmtap_v2_hdr_def = '!BBBBHBBLBBBB'
-    gsmtap_v3_hdr_def = '!BBBBHBBLBBBBQL'
-    gsmtap_hdr = b''
-
     # Sanity check - Wireshark GSMTAP dissector accepts only 14 bits of ARFCN
     if arfcn < 0 or arfcn > (2 ** 14 - 1):
         arfcn = 0
 
+    if version == 3 and (device_sec != 0 or device_usec != 0 or frame_number != 0):
+        return gsmtap_v3_hdr.pack(
+            3,                           # Version
+            7,                           # Header Length
+            payload_type,                # Type
+            timeslot,                    # GSM Timeslot
+            arfcn,                       # ARFCN
+            signal_dbm,                  # Signal dBm
+            snr_db,                      # SNR dB
+            frame_number,                # Frame Number
+            sub_type,                    # Subtype
+            antenna_nr,                  # Antenna Number
+            sub_slot,                    # Subslot
+            0,                           # Reserved
+            device_sec,
+            device_usec)
+    elif version == 2 and frame_number != 0:
+        return gsmtap_v2_hdr.pack(2, 4, payload_type, timeslot, arfcn,
+            signal_dbm, snr_db, frame_number, sub_type, antenna_nr, sub_slot, 0)
+
+    # Nothing varies per packet, reuse a prebuilt header
+    return _create_static_gsmtap_header(version, payload_type, timeslot,
+        arfcn, signal_dbm, snr_db, sub_type, antenna_nr, sub_slot)
+
+@functools.lru_cache(maxsize=256)
+def _create_static_gsmtap_header(version, payload_type, timeslot,
+    arfcn, signal_dbm, snr_db, sub_type, antenna_nr, sub_slot):
+    gsmtap_hdr = b''
+
     if version == 2:
-        gsmtap_hdr = struct.pack(gsmtap_v2_hdr_def,
+        gsmtap_hdr = gsmtap_v2_hdr.pack(
             2,                           # Version
             4,                           # Header Length
             payload_type,                # Type
@@ -260,14 +473,14 @@ def create_gsmtap_header(version = 2, payload_type = 0, timeslot = 0,
             arfcn,                       # ARFCN
             signal_dbm,                  # Signal dBm
             snr_db,                      # SNR dB
-            frame_number,                # Frame Number
+            0,                           # Frame Number
             sub_type,                    # Subtype
             antenna_nr,                  # Antenna Number
             sub_slot,                    # Subslot
             0                            # Reserved
             )
     elif version == 3:
-        gsmtap_hdr = struct.pack(gsmtap_v3_hdr_def,
+        gsmtap_hdr = gsmtap_v3_hdr.pack(
             3,                           # Version
             7,                           # Header Length
             payload_type,                # Type
@@ -275,22 +488,24 @@ def create_gsmtap_header(version = 2, payload_type = 0, timeslot = 0,
             arfcn,                       # ARFCN
             signal_dbm,                  # Signal dBm
             snr_db,                      # SNR dB
-            frame_number,                # Frame Number
+            0,                           # Frame Number
             sub_type,                    # Subtype
             antenna_nr,                  # Antenna Number
             sub_slot,                    # Subslot
             0,                           # Reserved
-            device_sec,
-            device_usec)
+            0,
+            0)
     else:
         assert (version == 2) or (version == 3), "GSMTAP version should be either 2 or 3"
 
     return gsmtap_hdr
 
-def create_osmocore_logging_header(timestamp = datetime.datetime.now(),
-        process_name = '', pid = 0, level = 0,
-        subsys_name = '', filename = '', line_number = 0):
+osmocore_log_hdr = struct.Struct('!LL72sL')
+osmocore_log_hdr_names = struct.Struct('!16sLB3x16s32s')
 
+@functools.lru_cache(maxsize=1024)
+def _create_osmocore_logging_header_names(process_name, pid, level, subsys_name, filename):
+    # Encoded and padded middle part, recurring for each event ID and message source
     if type(process_name) == str:
         process_name = process_name.encode('utf-8')
     if type(subsys_name) == str:
@@ -298,14 +513,26 @@ def create_osmocore_logging_header(timestamp = datetime.datetime.now(),
     if type(filename) == str:
         filename = filename.encode('utf-8')
 
-    logging_hdr = struct.pack('!LL16sLB3x16s32sL',
-        int(timestamp.timestamp()), # uint32_t sec
-        timestamp.microsecond, # uint32_t usec
+    return osmocore_log_hdr_names.pack(
         process_name, # uint8_t proc_name[16]
         pid, # uint32_t pid
         level, # uint8_t level
         subsys_name, # uint8_t subsys[16]
         filename, # uint8_t filename[32]
+    )
+
+def create_osmocore_logging_header(timestamp = None,
+        process_name = '', pid = 0, level = 0,
+        subsys_name = '', filename = '', line_number = 0):
+
+    if timestamp is None:
+        timestamp = time.time_ns()
+
+    ts_sec, ts_usec = ts_to_sec_usec(timestamp)
+    logging_hdr = osmocore_log_hdr.pack(
+        ts_sec, # uint32_t sec
+        ts_usec, # uint32_t usec
+        _create_osmocore_logging_header_names(process_name, pid, level, subsys_name, filename),
         line_number # uint32_t line_nr
     )
 
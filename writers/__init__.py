@@ -5,3 +5,4 @@ from .pcapwriter import PcapWriter
 from .socketwriter import SocketWriter
 from .rawwriter import RawWriter
 from .nullwriter import NullWriter
+from .latencywriter import LatencyWriter
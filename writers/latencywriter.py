@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# coding: utf8
+
+import collections
+import sys
+import time
+
+class LatencyWriter:
+    # Proxy in front of another writer, comparing the device timestamp of
+    # each packet with the host monotonic clock at emission.
+    # Both clocks have unrelated epochs: the offset is estimated as the
+    # smallest observed difference, i.e. the fastest packet is assumed to
+    # have zero latency. Raw differences are kept in a rolling window per
+    # packet source and the offset is applied when reporting.
+
+    def __init__(self, writer, stats = None, window = 1024):
+        self.writer = writer
+        self.stats = stats
+        self.window = window
+        self.min_delta = None
+        self.samples = { }
+
+    def __getattr__(self, name):
+        return getattr(self.writer, name)
+
+    def record(self, ts):
+        if ts is None:
+            # Packet without device timestamp
+            return
+
+        delta = time.monotonic_ns() - ts
+        if self.min_delta is None or delta < self.min_delta:
+            self.min_delta = delta
+
+        # Source of the packet as set by ParserStats.call()
+        key = self.stats.current if self.stats is not None else None
+        samples = self.samples.get(key)
+        if samples is None:
+            samples = collections.deque(maxlen = self.window)
+            self.samples[key] = samples
+        samples.append(delta)
+
+    def write_cp(self, sock_content, radio_id=0, ts=None):
+        self.record(ts)
+        self.writer.write_cp(sock_content, radio_id, ts)
+
+    def write_up(self, sock_content, radio_id=0, ts=None):
+        self.record(ts)
+        self.writer.write_up(sock_content, radio_id, ts)
+
+    def percentiles(self):
+        # (category, key) or None -> (samples, p50, p99, max) in ns
+        min_delta = self.min_delta
+        result = { }
+        for key, samples in list(self.samples.items()):
+            values = sorted(samples)
+            if len(values) == 0:
+                continue
+            n = len(values)
+            result[key] = (n,
+                values[min(n - 1, n // 2)] - min_delta,
+                values[min(n - 1, (n * 99) // 100)] - min_delta,
+                values[-1] - min_delta)
+        return result
+
+    def format_key(self, key):
+        if key is None:
+            return 'other'
+        category, code = key
+        if self.stats is not None:
+            return '{} {}'.format(category, self.stats.format_key(category, code))
+        return '{} {}'.format(category, code)
+
+    def format(self):
+        entries = sorted(self.percentiles().items(), key = lambda x: x[1][2], reverse = True)
+
+        lines = ['Device to output latency, last {} packets per source'.format(self.window)]
+        lines.append('{:20s} {:>8s} {:>10s} {:>10s} {:>10s}'.format(
+            'Source', 'Samples', 'p50 (ms)', 'p99 (ms)', 'max (ms)'))
+        for key, (n, p50, p99, p_max) in entries:
+            lines.append('{:20s} {:8d} {:10.3f} {:10.3f} {:10.3f}'.format(
+                self.format_key(key), n, p50 / 1e6, p99 / 1e6, p_max / 1e6))
+        return '\n'.join(lines)
+
+    def dump(self, f = None):
+        if f is None:
+            f = sys.stderr
+        f.write(self.format() + '\n')
+        f.flush()
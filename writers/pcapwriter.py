@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 # coding: utf8
 
-import datetime
 import struct
+import time
 
 class PcapWriter:
     def __init__(self, filename, port_cp = 4729, port_up = 47290):
@@ -26,10 +26,13 @@ class PcapWriter:
     def __enter__(self):
         return self
 
-    def write_pkt(self, sock_content, port, radio_id=0, ts=datetime.datetime.now()):
+    def write_pkt(self, sock_content, port, radio_id=0, ts=None):
+        # ts: nanoseconds since Unix epoch
+        if ts is None:
+            ts = time.time_ns()
         pcap_hdr = struct.pack('<LLLL',
-                int(ts.timestamp()),
-                ts.microsecond,
+                ts // 1000000000,
+                (ts // 1000) % 1000000,
                 len(sock_content) + 8 + 20 + 14,
                 len(sock_content) + 8 + 20 + 14,
                 )
@@ -63,10 +66,10 @@ class PcapWriter:
         if self.ip_id > 65535:
             self.ip_id = 0
 
-    def write_cp(self, sock_content, radio_id=0, ts=datetime.datetime.now()):
+    def write_cp(self, sock_content, radio_id=0, ts=None):
         self.write_pkt(sock_content, self.port_cp, radio_id, ts)
 
-    def write_up(self, sock_content, radio_id=0, ts=datetime.datetime.now()):
+    def write_up(self, sock_content, radio_id=0, ts=None):
         self.write_pkt(sock_content, self.port_up, radio_id, ts)
 
     def __exit__(self, exc_type, exc_value, traceback):
@@ -1,8 +1,6 @@
 #!/usr/bin/env python3
 # coding: utf8
 
-import datetime
-
 class RawWriter:
     def __init__(self, fname, header=b'', trailer=b''):
         self.raw_file = open(fname, 'wb')
@@ -12,10 +10,10 @@ class RawWriter:
     def __enter__(self):
         return self
 
-    def write_cp(self, sock_content, radio_id=0, ts=datetime.datetime.now()):
+    def write_cp(self, sock_content, radio_id=0, ts=None):
         self.raw_file.write(sock_content)
 
-    def write_up(self, sock_content, radio_id=0, ts=datetime.datetime.now()):
+    def write_up(self, sock_content, radio_id=0, ts=None):
         self.raw_file.write(sock_content)
 
     def __exit__(self, exc_type, exc_value, traceback):